@@ -0,0 +1,122 @@
+"""
+Packs the avatar sprites in static/ into a single atlas image.
+
+The atlas is written to static/build/ as a PNG and a WebP variant whose
+filenames contain a hash of their content, so the overlay can cache them
+forever. static/build/atlas.json describes the layout.
+
+Run it by hand after editing sprites:
+
+    python atlas.py
+
+The avatar server also calls load_or_build_atlas() at startup and rebuilds the
+atlas whenever the source sprites have changed.
+"""
+import hashlib
+import io
+import json
+import math
+import os
+import sys
+
+# Sprite names the overlay uses (static/<name>.png)
+SPRITES = ["happy", "happy_talk", "sad", "sad_talk", "angry", "angry_talk", "blink"]
+BUILD_DIR = "build"
+MANIFEST_FILE = "atlas.json"
+HASH_LENGTH = 12
+
+def _source_hash(static_dir):
+    """Hash of all source sprites, used to detect when the atlas is stale."""
+    digest = hashlib.sha256()
+    for name in SPRITES:
+        with open(os.path.join(static_dir, f"{name}.png"), "rb") as f:
+            digest.update(name.encode("utf-8"))
+            digest.update(f.read())
+    return digest.hexdigest()
+
+def _write_hashed(build_dir, data, extension):
+    name = f"atlas.{hashlib.sha256(data).hexdigest()[:HASH_LENGTH]}.{extension}"
+    with open(os.path.join(build_dir, name), "wb") as f:
+        f.write(data)
+    return name
+
+def build_atlas(static_dir):
+    """
+    Pack the sprites into one image, write the PNG/WebP files and manifest.
+    Returns the manifest dict.
+    """
+    from PIL import Image
+
+    images = [Image.open(os.path.join(static_dir, f"{name}.png")).convert("RGBA") for name in SPRITES]
+    width, height = images[0].size
+    for name, image in zip(SPRITES, images):
+        if image.size != (width, height):
+            raise ValueError(f"Sprite {name}.png is {image.size}, expected {(width, height)}")
+
+    # Near-square grid keeps the texture well under GPU size limits
+    columns = math.ceil(math.sqrt(len(images)))
+    rows = math.ceil(len(images) / columns)
+    sheet = Image.new("RGBA", (columns * width, rows * height), (0, 0, 0, 0))
+    frames = {}
+    for index, (name, image) in enumerate(zip(SPRITES, images)):
+        col, row = index % columns, index // columns
+        sheet.paste(image, (col * width, row * height))
+        frames[name] = [col, row]
+
+    build_dir = os.path.join(static_dir, BUILD_DIR)
+    os.makedirs(build_dir, exist_ok=True)
+
+    png = io.BytesIO()
+    sheet.save(png, format="PNG", optimize=True)
+    webp = io.BytesIO()
+    sheet.save(webp, format="WEBP", lossless=True, method=6)
+
+    manifest = {
+        "source_hash": _source_hash(static_dir),
+        "frame_width": width,
+        "frame_height": height,
+        "columns": columns,
+        "rows": rows,
+        "frames": frames,
+        "png": _write_hashed(build_dir, png.getvalue(), "png"),
+        "webp": _write_hashed(build_dir, webp.getvalue(), "webp"),
+    }
+
+    # Drop atlases from earlier builds
+    for entry in os.listdir(build_dir):
+        if entry.startswith("atlas.") and entry not in (manifest["png"], manifest["webp"], MANIFEST_FILE):
+            os.remove(os.path.join(build_dir, entry))
+
+    with open(os.path.join(build_dir, MANIFEST_FILE), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+def load_or_build_atlas(static_dir):
+    """
+    Return the atlas manifest, rebuilding the atlas if the sprites changed.
+    Returns None if no atlas can be produced (e.g. Pillow isn't installed),
+    in which case the overlay uses the individual sprite files.
+    """
+    manifest_path = os.path.join(static_dir, BUILD_DIR, MANIFEST_FILE)
+    try:
+        current_hash = _source_hash(static_dir)
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        files_exist = all(os.path.exists(os.path.join(static_dir, BUILD_DIR, manifest[key])) for key in ("png", "webp"))
+        if manifest.get("source_hash") == current_hash and files_exist:
+            return manifest
+    except (OSError, ValueError, KeyError):
+        pass
+
+    try:
+        return build_atlas(static_dir)
+    except ImportError:
+        print("Pillow is not installed; serving individual avatar sprites.")
+    except Exception as e:
+        print(f"Could not build sprite atlas: {e}")
+    return None
+
+if __name__ == "__main__":
+    static = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+    result = build_atlas(static)
+    print(f"Wrote {result['png']} and {result['webp']} ({result['columns']}x{result['rows']} frames)")
@@ -1,10 +1,14 @@
-import threading
 import asyncio
-import random
+import base64
+import json
 import os
 import sys
-import logging
-from flask import Flask, jsonify, render_template
+import time
+from aiohttp import web
+from atlas import load_or_build_atlas, BUILD_DIR
+from channels import CHANNELS, get_channel
+from diagnostics import add_admin_routes, start_monitoring
+from settings import settings
 
 def get_base_dir():
     """
@@ -20,113 +24,251 @@ def get_base_dir():
         return os.path.dirname(os.path.abspath(__file__))
 
 base_dir = get_base_dir()
+static_dir = os.path.join(base_dir, "static")        # external 'static' folder
+template_dir = os.path.join(base_dir, "templates")   # external 'templates' folder
+output_dir = os.path.abspath(settings.output_dir)     # synthesized clips
 
-app = Flask(
-    __name__,
-    static_folder=os.path.join(base_dir, "static"),    # external 'static' folder
-    template_folder=os.path.join(base_dir, "templates")  # external 'templates' folder
-)
+# Diagnostics under /admin/ (see diagnostics.py)
+admin_config = settings.config.get('avatar', {}).get('admin', {})
+ADMIN_ENABLED = admin_config.get('enabled', True)
 
-###############################################################################
-# Global State
-###############################################################################
-current_emotion = "happy"  # "happy", "sad", "angry", etc.
-is_talking = False
-
-# We'll keep a reference to a "revert to happy" timer (async Task) if scheduled
-revert_timer_task = None
 REVERT_DELAY_SECONDS = 3  # How many seconds after idle to force revert to "happy"
 
 ###############################################################################
-# Revert Timer Logic (Server-Side)
+# Avatar State
 ###############################################################################
-async def _revert_after_delay(seconds: float):
+class AvatarState:
     """
-    Wait 'seconds' while the avatar is idle (talking=False).
-    If still not talking at the end, and not already happy, revert to "happy".
+    Single owner of the overlay state (emotion / talking).
+    All mutation happens on the event loop the server runs on; callers on other
+    threads are forwarded there by set_avatar_state().
     """
-    await asyncio.sleep(seconds)
-    # Double-check we're still idle
-    if not is_talking and current_emotion != "happy":
-        set_avatar_state(emotion="happy")
 
-def _schedule_revert_to_happy(seconds: float):
-    """
-    Cancel any existing revert timer, then schedule a new one.
-    """
-    global revert_timer_task
-    # Cancel old task if exists
-    if revert_timer_task and not revert_timer_task.done():
-        revert_timer_task.cancel()
-    # Create new task
-    loop = asyncio.get_event_loop()
-    revert_timer_task = loop.create_task(_revert_after_delay(seconds))
+    def __init__(self):
+        self.emotion = "happy"  # "happy", "sad", "angry", etc.
+        self.talking = False
+        # Lip-sync data for the clip currently playing (see lipsync.py)
+        self.clip_id = 0
+        self.envelope = None     # base64 of one loudness byte per frame
+        self.frame_ms = None
+        self.started_at = None   # playback start, ms since epoch
+        self.audio = None        # clip URL when the overlay itself plays the audio
+        self.loop = None
+        # Reference to a "revert to happy" timer (async Task) if scheduled
+        self._revert_task = None
+
+    def bind(self, loop):
+        self.loop = loop
+
+    def snapshot(self):
+        return {
+            "emotion": self.emotion,
+            "talking": self.talking,
+            "clip": self.clip_id,
+            "envelope": self.envelope,
+            "frame_ms": self.frame_ms,
+            "started_at": self.started_at,
+            "audio": self.audio,
+            "now": time.time() * 1000  # lets the overlay correct for clock offset
+        }
+
+    def update(self, emotion=None, talking=None, envelope=None, frame_ms=None, started_at=None, audio=None):
+        old_talking = self.talking
+
+        if emotion is not None:
+            self.emotion = emotion
+        if talking is not None:
+            self.talking = talking
+
+        if self.talking and started_at is not None:
+            # A new clip started playing
+            self.clip_id += 1
+            self.envelope = base64.b64encode(envelope).decode("ascii") if envelope else None
+            self.frame_ms = frame_ms
+            self.started_at = started_at * 1000
+            self.audio = audio
+        elif not self.talking:
+            self.envelope = self.frame_ms = self.started_at = self.audio = None
+
+        # If we just switched from talking=True -> talking=False
+        if old_talking and not self.talking:
+            # If the new emotion is not "happy", schedule a revert
+            if self.emotion != "happy":
+                self._schedule_revert(REVERT_DELAY_SECONDS)
+
+        # If we just switched from talking=False -> talking=True,
+        # or changed emotion while talking => cancel any pending revert
+        if self.talking:
+            self._cancel_revert()
+
+    def _cancel_revert(self):
+        if self._revert_task and not self._revert_task.done():
+            self._revert_task.cancel()
+        self._revert_task = None
+
+    def _schedule_revert(self, seconds: float):
+        """
+        Cancel any existing revert timer, then schedule a new one on the owning loop.
+        """
+        self._cancel_revert()
+        loop = self.loop or asyncio.get_running_loop()
+        self._revert_task = loop.create_task(self._revert_after_delay(seconds))
 
+    async def _revert_after_delay(self, seconds: float):
+        """
+        Wait 'seconds' while the avatar is idle (talking=False).
+        If still not talking at the end, and not already happy, revert to "happy".
+        """
+        await asyncio.sleep(seconds)
+        # Double-check we're still idle
+        if not self.talking and self.emotion != "happy":
+            self.update(emotion="happy")
+
+# One state per channel; the first configured channel is served at "/"
+states = {name: AvatarState() for name in CHANNELS}
+
+def get_state(channel=None):
+    return states[get_channel(channel).name]
 
 ###############################################################################
 # Public Function Called by main.py
 ###############################################################################
-def set_avatar_state(emotion=None, talking=None):
+def set_avatar_state(emotion=None, talking=None, envelope=None, frame_ms=None, started_at=None,
+                     channel=None, audio_file=None):
     """
     Called by main.py to update the avatar's emotion or talking state.
+    When a clip starts, pass its lip-sync 'envelope', 'frame_ms' and the
+    playback 'started_at' time (time.time()) so the overlay can follow the audio.
+    'channel' picks whose overlay to update (default: the first channel); pass
+    'audio_file' to have that overlay play the clip itself.
+    Safe to call from any thread; the update always runs on the server's loop.
     """
-    global current_emotion, is_talking
-
-    old_emotion = current_emotion
-    old_talking = is_talking
-
-    if emotion is not None:
-        current_emotion = emotion
-    if talking is not None:
-        is_talking = talking
-
-    # If we just switched from talking=True -> talking=False
-    if old_talking and not is_talking:
-        # If the new emotion is not "happy", schedule a revert
-        if current_emotion != "happy":
-            _schedule_revert_to_happy(REVERT_DELAY_SECONDS)
-        # Otherwise, do nothing (already happy)
-    
-    # If we just switched from talking=False -> talking=True,
-    # or changed emotion while talking => cancel any pending revert
-    if is_talking:
-        global revert_timer_task
-        if revert_timer_task and not revert_timer_task.done():
-            revert_timer_task.cancel()
-            revert_timer_task = None
+    state = get_state(channel)
+    audio = f"clips/{os.path.basename(audio_file)}" if audio_file else None
+    loop = state.loop
+    if loop is not None and loop.is_running() and not _on_loop_thread(loop):
+        loop.call_soon_threadsafe(state.update, emotion, talking, envelope, frame_ms, started_at, audio)
+    else:
+        state.update(emotion, talking, envelope, frame_ms, started_at, audio)
 
+def _on_loop_thread(loop):
+    try:
+        return asyncio.get_running_loop() is loop
+    except RuntimeError:
+        return False
 
 ###############################################################################
-# Flask Routes
+# HTTP Routes
 ###############################################################################
-@app.route("/")
-def index():
-    return render_template("index.html")
+NO_CACHE_HEADERS = {"Cache-Control": "no-cache"}
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+ATLAS_PLACEHOLDER = "/*ATLAS_MANIFEST*/null"
+BUILD_URL_PREFIX = f"/static/{BUILD_DIR}/"
 
-@app.route("/api/state")
-def api_state():
+def _overlay_atlas(manifest):
+    """The subset of the atlas manifest the overlay needs, with URLs."""
+    if not manifest:
+        return None
     return {
-        "emotion": current_emotion,
-        "talking": is_talking
+        "columns": manifest["columns"],
+        "rows": manifest["rows"],
+        "frames": manifest["frames"],
+        "png": BUILD_URL_PREFIX + manifest["png"],
+        "webp": BUILD_URL_PREFIX + manifest["webp"],
     }
 
+async def index(request):
+    # Read on every request so edits to index.html show up without a restart
+    with open(os.path.join(template_dir, "index.html"), encoding="utf-8") as f:
+        html = f.read()
+    html = html.replace(ATLAS_PLACEHOLDER, json.dumps(_overlay_atlas(request.app["atlas"])))
+    return web.Response(text=html, content_type="text/html", headers=NO_CACHE_HEADERS)
+
+def _request_state(request):
+    try:
+        return get_state(request.match_info.get("channel"))
+    except KeyError:
+        raise web.HTTPNotFound()
+
+async def channel_index(request):
+    _request_state(request)
+    # The overlay uses relative URLs, so it needs the trailing slash
+    if not request.path.endswith("/"):
+        raise web.HTTPFound(request.path + "/")
+    return await index(request)
+
+async def api_state(request):
+    return web.json_response(_request_state(request).snapshot(), headers={"Cache-Control": "no-store"})
+
+async def channel_clip(request):
+    """Serve a synthesized clip to a channel overlay that plays its own audio."""
+    # / and /clips/ belong to the first channel, /c/<channel>/ to the named one
+    _request_state(request)  # 404 for unknown channels
+    channel = get_channel(request.match_info.get("channel")).name
+    name = request.match_info["name"]
+    if os.path.basename(name) != name or not name.startswith(f"voice_output_{channel}_"):
+        raise web.HTTPNotFound()
+    path = os.path.join(output_dir, name)
+    if not os.path.isfile(path):
+        raise web.HTTPNotFound()
+    return web.FileResponse(path)
+
+async def _set_cache_headers(request, response):
+    # Built atlas files have content-hashed names, so they never change
+    if request.path.startswith(BUILD_URL_PREFIX) and not request.path.endswith(".json"):
+        response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+
+def create_app(atlas=None):
+    app = web.Application()
+    app["atlas"] = atlas
+    app.on_response_prepare.append(_set_cache_headers)
+    app.router.add_get("/", index)
+    app.router.add_get("/api/state", api_state)
+    app.router.add_get("/clips/{name}", channel_clip)
+    # Per-channel overlays for multi-channel mode: /c/<channel>/
+    app.router.add_get("/c/{channel}", channel_index)
+    app.router.add_get("/c/{channel}/", channel_index)
+    app.router.add_get("/c/{channel}/api/state", api_state)
+    app.router.add_get("/c/{channel}/clips/{name}", channel_clip)
+    app.router.add_static("/static", static_dir)
+    if ADMIN_ENABLED:
+        add_admin_routes(app, admin_config.get('token', ''))
+    return app
+
 ###############################################################################
-# Run Flask without dev logs
+# Run the server on the caller's event loop
 ###############################################################################
-def _run_flask():
-    # Disable flask/werkzeug logs
-    log = logging.getLogger('werkzeug')
-    log.disabled = True
-    app.logger.disabled = True
-
-    # Run the server
-    app.run(host="127.0.0.1", port=5000, debug=False, use_reloader=False)
+_runner = None
+_monitor_task = None
 
-async def run_avatar_server():
+async def run_avatar_server(host="127.0.0.1", port=5000):
     """
     Called by main.py in an async task.
-    Spawns a thread to run the Flask webserver.
+    Serves the overlay from the running event loop (no extra thread) with
+    HTTP keep-alive, so any number of overlay clients can poll concurrently.
     """
-    thread = threading.Thread(target=_run_flask, daemon=True)
-    thread.start()
-    await asyncio.sleep(0)  # yield so the thread can start
+    global _runner, _monitor_task
+    loop = asyncio.get_running_loop()
+    for state in states.values():
+        state.bind(loop)
+    if ADMIN_ENABLED and _monitor_task is None:
+        _monitor_task = start_monitoring(admin_config.get('lag_interval_ms', 100) / 1000,
+                                         admin_config.get('stall_ms', 250))
+
+    # Packing the sprites is a one-off when they change; keep it off the loop
+    atlas = await loop.run_in_executor(None, load_or_build_atlas, static_dir)
+
+    # access_log=None keeps per-request logs out of log.log
+    _runner = web.AppRunner(create_app(atlas), access_log=None, keepalive_timeout=75)
+    await _runner.setup()
+    site = web.TCPSite(_runner, host, port)
+    await site.start()
+
+async def stop_avatar_server():
+    global _runner, _monitor_task
+    if _monitor_task is not None:
+        _monitor_task.cancel()
+        _monitor_task = None
+    if _runner is not None:
+        await _runner.cleanup()
+        _runner = None
@@ -0,0 +1,75 @@
+"""
+Load test for the avatar overlay server.
+
+Runs N concurrent keep-alive clients against /api/state (the endpoint every
+overlay polls) for a fixed duration and prints requests/sec and latency.
+
+By default an in-process server is started on a free port; pass --url to point
+the clients at an already running server (e.g. an older build) to compare.
+
+    python benchmarks/avatar_server.py --clients 8 --seconds 5
+    python benchmarks/avatar_server.py --url http://127.0.0.1:5000/api/state
+"""
+import argparse
+import asyncio
+import os
+import socket
+import sys
+import time
+
+import aiohttp
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+async def client_loop(session, url, deadline, latencies):
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        async with session.get(url) as resp:
+            await resp.read()
+        latencies.append(time.perf_counter() - start)
+
+async def run(url, clients, seconds):
+    latencies = []
+    connector = aiohttp.TCPConnector(limit=clients)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        # Warm the connections up before measuring
+        await asyncio.gather(*(session.get(url) for _ in range(clients)))
+        deadline = time.perf_counter() + seconds
+        await asyncio.gather(*(client_loop(session, url, deadline, latencies) for _ in range(clients)))
+    return latencies
+
+def report(latencies, seconds):
+    latencies.sort()
+    count = len(latencies)
+    p50 = latencies[count // 2] * 1000
+    p99 = latencies[min(count - 1, int(count * 0.99))] * 1000
+    print(f"{count} requests in {seconds:.1f}s -> {count / seconds:.0f} req/s "
+          f"(p50 {p50:.2f} ms, p99 {p99:.2f} ms)")
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="Benchmark an existing server instead of starting one")
+    parser.add_argument("--clients", type=int, default=8, help="Concurrent overlay clients")
+    parser.add_argument("--seconds", type=float, default=5.0, help="Measurement duration")
+    args = parser.parse_args()
+
+    url = args.url
+    if not url:
+        from avatar import run_avatar_server, stop_avatar_server
+        port = free_port()
+        await run_avatar_server(port=port)
+        url = f"http://127.0.0.1:{port}/api/state"
+
+    latencies = await run(url, args.clients, args.seconds)
+    report(latencies, args.seconds)
+
+    if not args.url:
+        await stop_avatar_server()
+
+if __name__ == "__main__":
+    asyncio.run(main())
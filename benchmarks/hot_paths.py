@@ -0,0 +1,268 @@
+"""
+Micro-benchmarks for the per-message and per-response hot paths, with a
+regression gate.
+
+Every case runs against deterministic synthetic data (fixed seeds) and
+reports operations per second (best of several rounds). The gate doesn't
+compare raw ops/s, which depend on the machine and how busy it is: right
+before each case, a fixed pure-Python reference workload is timed, and the
+case is scored as its ops/s relative to the reference. The run fails if any
+case's score is more than --threshold below its baseline.
+
+Baselines are still machine-specific (I/O-heavy cases don't scale with CPU
+speed), so they are not committed. Record one on the machine that runs the
+gate, before the change you want to check, and re-save it after an
+intentional change:
+
+    python benchmarks/hot_paths.py --save-baseline
+    python benchmarks/hot_paths.py
+    python benchmarks/hot_paths.py --filter history --rounds 10
+
+The baseline goes to benchmarks/hot_paths_baseline.json (ignored by git).
+Without one, the run just prints the numbers.
+
+Each run works in a scratch directory with a copy of config.json, so nothing
+is written to the repo.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_FILE = os.path.join(REPO_DIR, "benchmarks", "hot_paths_baseline.json")
+
+# Allowed slowdown against the baseline before the run fails
+REGRESSION_THRESHOLD = 0.25
+
+# The gate times in short slices: long ones are more likely to be interrupted
+SLICE_TIME = 0.05
+SLICES_PER_ROUND = 4
+
+SEED = 1234
+WORDS = ("lol gg pog what is this game chat hello how are you doing today nice play "
+         "that boss was hard did you see the clip earlier can we get a hype train "
+         "whats the build for this character emote spam kappa").split()
+
+def make_usernames(count, seed=SEED):
+    rng = random.Random(seed)
+    return [f"{rng.choice(WORDS)}_{rng.choice(WORDS)}{rng.randrange(1000)}" for _ in range(count)]
+
+def make_messages(count, ai_name, mention_rate=0.05, seed=SEED):
+    """Chat messages of 1-25 words; about mention_rate of them name the AI."""
+    rng = random.Random(seed)
+    messages = []
+    for _ in range(count):
+        words = [rng.choice(WORDS) for _ in range(rng.randint(1, 25))]
+        if rng.random() < mention_rate:
+            words.insert(rng.randrange(len(words) + 1), rng.choice([ai_name, ai_name.lower(), f"@{ai_name}"]))
+        messages.append(" ".join(words))
+    return messages
+
+def make_privmsg_lines(count, channel, ai_name, seed=SEED):
+    """Raw IRC lines as IrcClient hands them to the chat callback (tags stripped)."""
+    users = make_usernames(200, seed)
+    rng = random.Random(seed + 1)
+    return [f":{user}!{user}@{user}.tmi.twitch.tv PRIVMSG #{channel} :{message}"
+            for user, message in ((rng.choice(users), m) for m in make_messages(count, ai_name, seed=seed))]
+
+def make_responses(count, seed=SEED):
+    """Model replies, most with an emotion prefix as the system prompt asks for."""
+    rng = random.Random(seed)
+    prefixes = ["[HAPPY] ", "[happy]", "[Sad] ", "[ANGRY] ", "[excited] ", ""]
+    return [rng.choice(prefixes) + " ".join(rng.choice(WORDS) for _ in range(rng.randint(5, 30)))
+            for _ in range(count)]
+
+def measure(fn, ops_per_call, rounds, setup=None, min_time=0.2):
+    """
+    Best-of-'rounds' throughput of fn() in operations per second. Each round
+    repeats fn() for at least min_time; setup(), if given, runs before every
+    call and is not timed.
+    """
+    best = 0.0
+    for _ in range(rounds):
+        elapsed = 0.0
+        calls = 0
+        while elapsed < min_time:
+            if setup is not None:
+                setup()
+            start = time.perf_counter()
+            fn()
+            elapsed += time.perf_counter() - start
+            calls += 1
+        best = max(best, calls * ops_per_call / elapsed)
+    return best
+
+def reference_workload():
+    """Fixed CPU-bound work the cases are scored against: parsing, dict updates, sorting."""
+    counts = {}
+    for i in range(2000):
+        user, _, text = f"user{i % 97}:chat message number {i}".partition(":")
+        counts[user] = counts.get(user, 0) + len(text.split())
+    return sorted(counts.items(), key=lambda item: item[1])
+
+def build_cases(workdir):
+    """Name -> (fn, ops_per_call, setup) for every benchmark case."""
+    from response_formatter import format_chat_message, extract_emotion, chat_channel
+    from channels import get_channel, RoomContext
+    from gpt import save_message, read_user_history, max_messages
+    from twitch_chat import read_blacklist
+    from voice_queue import cleanup_mp3_files
+    from pathlib import Path
+
+    channel = get_channel()
+    lines = make_privmsg_lines(5000, channel.name, channel.ai_name)
+    messages = make_messages(5000, channel.ai_name)
+    responses = make_responses(5000)
+    cases = {}
+
+    cases["format_chat_message"] = (lambda: [format_chat_message(line) for line in lines], len(lines), None)
+    cases["chat_channel"] = (lambda: [chat_channel(line) for line in lines], len(lines), None)
+    cases["extract_emotion"] = (lambda: [extract_emotion(text) for text in responses], len(responses), None)
+    cases["mention_check"] = (lambda: [channel.mentions_ai(message) for message in messages], len(messages), None)
+
+    # Room context: every chat line is added; each reply renders the room as it
+    # was before the message it answers, so consecutive renders differ
+    room = RoomContext(50, 300)
+
+    def add_lines():
+        for message in messages:
+            room.add("viewer", message)
+
+    def render_replies():
+        newest = room.add("viewer", "gg")
+        return [room.render(before=newest - i % 20) for i in range(1000)]
+    cases["room_context_add"] = (add_lines, len(messages), None)
+    cases["room_context_render"] = (render_replies, 1000, None)
+
+    # Chat history at its cap (max_messages user messages plus replies) for 100 users
+    history_dir = os.path.join(workdir, "user_data")
+    users = make_usernames(100)
+    for index, user in enumerate(users):
+        for message in make_messages(max_messages, channel.ai_name, seed=SEED + index):
+            save_message(user, "user", message, history_dir=history_dir)
+            save_message(user, "ai", message[::-1], ai_name=channel.ai_name, history_dir=history_dir)
+    rng = random.Random(SEED)
+    picks = [rng.choice(users) for _ in range(50)]
+
+    def save_exchange():
+        for user in picks:
+            save_message(user, "user", "what is the build for this character", history_dir=history_dir)
+            save_message(user, "ai", "Glass cannon, all in on damage!", ai_name=channel.ai_name, history_dir=history_dir)
+    cases["save_message"] = (save_exchange, len(picks) * 2, None)
+    cases["read_user_history"] = (lambda: [read_user_history(user, history_dir) for user in picks], len(picks), None)
+
+    # A blacklist of 500 names, re-read on every chat message
+    blacklist_path = os.path.join(workdir, "blacklist.txt")
+    with open(blacklist_path, "w") as f:
+        f.write("\n".join(make_usernames(500, seed=SEED + 2)))
+    blacklist_config = {"paths": {"blacklist": blacklist_path}}
+    loop = asyncio.new_event_loop()
+
+    async def read_blacklists():
+        for _ in range(100):
+            await read_blacklist(blacklist_config)
+    cases["read_blacklist"] = (lambda: loop.run_until_complete(read_blacklists()), 100, None)
+
+    # The output folder as the TTS workers leave it: clips with their envelopes
+    output_dir = Path(workdir) / "output"
+    output_dir.mkdir(exist_ok=True)
+    clip_index = iter(range(10**9))
+
+    def add_clips(count):
+        for _ in range(count):
+            clip = output_dir / f"voice_output_{channel.name}_{next(clip_index):09d}.mp3"
+            clip.write_bytes(b"\0" * 1024)
+            clip.with_suffix(".env").write_bytes(b"\0" * 64)
+
+    add_clips(20)
+    # Steady state: at the cap, nothing to delete
+    cases["cleanup_mp3_files"] = (lambda: loop.run_until_complete(cleanup_mp3_files(output_dir, max_files=20)), 1, None)
+    # A new clip arrived: one clip and its envelope go
+    cases["cleanup_mp3_files_prune"] = (lambda: loop.run_until_complete(cleanup_mp3_files(output_dir, max_files=20)),
+                                        1, lambda: add_clips(1))
+    return cases
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--filter", default="", help="Only run cases whose name contains this")
+    parser.add_argument("--rounds", type=int, default=5, help="Timing rounds per case (each is a few short slices; the best slice counts)")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD,
+                        help="Fail when a case is this fraction slower than its baseline")
+    parser.add_argument("--confirm", type=int, default=2,
+                        help="Re-measure a case up to this many times before reporting a regression")
+    parser.add_argument("--save-baseline", action="store_true", help="Store these results as the new baseline")
+    args = parser.parse_args()
+
+    try:
+        with open(BASELINE_FILE) as f:
+            baseline = json.load(f)
+    except (OSError, ValueError):
+        baseline = {}
+
+    with tempfile.TemporaryDirectory() as workdir:
+        shutil.copy(os.path.join(REPO_DIR, "config.json"), workdir)
+        os.chdir(workdir)
+        sys.path.insert(0, REPO_DIR)
+        cases = build_cases(workdir)
+
+        def score(fn, ops_per_call, setup):
+            """
+            (ops/s, ops/s relative to the reference workload). The two are
+            timed in short interleaved slices and the best slice of each
+            counts, so a burst of load elsewhere hits both or neither.
+            """
+            reference = ops = 0.0
+            for _ in range(args.rounds * SLICES_PER_ROUND):
+                reference = max(reference, measure(reference_workload, 1, 1, min_time=SLICE_TIME))
+                ops = max(ops, measure(fn, ops_per_call, 1, setup, min_time=SLICE_TIME))
+            return ops, ops / reference
+
+        results = {}
+        regressions = []
+        print(f"{'case':<26} {'ops/s':>12} {'score':>10} {'baseline':>10} {'change':>8}")
+        for name, (fn, ops_per_call, setup) in cases.items():
+            if args.filter not in name:
+                continue
+            ops, relative = score(fn, ops_per_call, setup)
+            base = baseline.get(name)
+            # Re-measure before calling it a regression; a busy machine makes single runs noisy
+            for _ in range(args.confirm):
+                if not base or relative >= base * (1 - args.threshold):
+                    break
+                ops, relative = max((ops, relative), score(fn, ops_per_call, setup), key=lambda result: result[1])
+            results[name] = round(relative, 4)
+            if base:
+                change = relative / base - 1
+                flag = "  REGRESSION" if change < -args.threshold else ""
+                if flag:
+                    regressions.append(name)
+                print(f"{name:<26} {ops:12,.0f} {relative:10.4f} {base:10.4f} {change:+8.1%}{flag}")
+            else:
+                print(f"{name:<26} {ops:12,.0f} {relative:10.4f} {'-':>10} {'':>8}")
+        os.chdir(REPO_DIR)
+
+    if args.save_baseline:
+        baseline.update(results)
+        with open(BASELINE_FILE, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"\nSaved baseline for {len(results)} cases to {os.path.relpath(BASELINE_FILE, REPO_DIR)}")
+        return
+
+    if not baseline:
+        print(f"\nNo baseline yet; record one on this machine with --save-baseline")
+        return
+    if regressions:
+        print(f"\nFAIL: {len(regressions)} case(s) more than {args.threshold:.0%} slower than baseline: "
+              + ", ".join(regressions))
+        sys.exit(1)
+    print("\nOK")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Import-time profile of the bot's startup with a regression budget.
+
+Imports main.py in a fresh interpreter with `-X importtime`, prints the most
+expensive imports, and exits non-zero when the total import time is over the
+budget. Each run uses a scratch working directory with a copy of config.json,
+so nothing is written to the repo.
+
+    python benchmarks/startup.py
+    python benchmarks/startup.py --budget-ms 600 --top 20
+"""
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Total import time allowed for `import main`, in milliseconds
+STARTUP_BUDGET_MS = 600
+
+def profile_imports(module="main"):
+    """
+    Import 'module' in a new interpreter and return a list of
+    (self_us, cumulative_us, depth, name) for every import.
+    """
+    with tempfile.TemporaryDirectory() as workdir:
+        shutil.copy(os.path.join(REPO_DIR, "config.json"), workdir)
+        env = dict(os.environ, PYTHONPATH=REPO_DIR, PYTHONDONTWRITEBYTECODE="1")
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            cwd=workdir, env=env, capture_output=True, text=True
+        )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        depth = (len(name) - len(name.lstrip())) // 2
+        entries.append((int(self_us), int(cumulative_us), depth, name.strip()))
+    return entries
+
+def total_import_ms(entries):
+    # Top-level imports (depth 0 after the leading space) already include their children
+    return sum(cumulative for _, cumulative, depth, _ in entries if depth == 0) / 1000
+
+def report(entries, top):
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+    for self_us, cumulative_us, _, name in sorted(entries, key=lambda e: e[1], reverse=True)[:top]:
+        print(f"{cumulative_us / 1000:14.1f} {self_us / 1000:9.1f}  {name}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="main", help="Module to import")
+    parser.add_argument("--budget-ms", type=float, default=STARTUP_BUDGET_MS, help="Fail above this total")
+    parser.add_argument("--runs", type=int, default=3, help="Take the median of this many runs")
+    parser.add_argument("--top", type=int, default=15, help="How many imports to list")
+    args = parser.parse_args()
+
+    runs = [profile_imports(args.module) for _ in range(args.runs)]
+    totals = [total_import_ms(entries) for entries in runs]
+    median = statistics.median(totals)
+    report(runs[totals.index(median)], args.top)
+
+    print(f"\nimport {args.module}: {median:.1f} ms (median of {args.runs}), budget {args.budget_ms:.0f} ms")
+    if median > args.budget_ms:
+        print("FAIL: startup import time is over budget")
+        sys.exit(1)
+    print("OK")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Regression checks for the energy VAD (vad.EnergyVad) on synthetic audio.
+
+Each scenario feeds generated audio through the detector in blocks, the way
+ui.ContinuousListener does, and checks the share of frames classified as
+speech in one stretch of it. Exits non-zero if any scenario fails.
+
+    python benchmarks/vad_scenarios.py
+"""
+import os
+import sys
+
+import numpy as np
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from vad import EnergyVad  # noqa: E402
+
+SAMPLE_RATE = 16000
+FRAME_MS = 30
+FRAMES_PER_BLOCK = 3  # as in ui.VAD_FRAMES_PER_BLOCK
+SEED = 1234
+
+def noise(seconds, db, rng):
+    """White noise at roughly 'db' dBFS (mean power)."""
+    return rng.normal(0, 10 ** (db / 20), int(SAMPLE_RATE * seconds)).astype(np.float32)
+
+def tone(seconds, db, freq=200):
+    t = np.arange(int(SAMPLE_RATE * seconds)) / SAMPLE_RATE
+    # A sine's mean power is amplitude^2 / 2
+    return (np.sqrt(2) * 10 ** (db / 20) * np.sin(2 * np.pi * freq * t)).astype(np.float32)
+
+def silence(seconds):
+    """Digital silence, as from a muted mic."""
+    return np.zeros(int(SAMPLE_RATE * seconds), dtype=np.float32)
+
+def speech_share(parts, measured):
+    """
+    Run the concatenated 'parts' through a fresh detector and return the share
+    of speech frames within part number 'measured'.
+    """
+    frame_len = SAMPLE_RATE * FRAME_MS // 1000
+    detector = EnergyVad(SAMPLE_RATE, FRAME_MS)
+    flags = []
+    for part in parts:
+        frames = part[:len(part) // frame_len * frame_len].reshape(-1, frame_len)
+        part_flags = [detector.is_speech(frames[i:i + FRAMES_PER_BLOCK])
+                      for i in range(0, len(frames), FRAMES_PER_BLOCK)]
+        flags.append(np.concatenate(part_flags))
+    return float(flags[measured].mean())
+
+def scenarios():
+    """Name -> (share of speech frames, expected range)."""
+    rng = np.random.default_rng(SEED)
+    room = lambda seconds: noise(seconds, -55, rng)
+    return {
+        # Continuous voiced sound must not teach the floor that it's background
+        "steady_tone_20s": (speech_share([room(2), tone(20, -20) + room(20)], 1), (0.95, 1.0)),
+        # Muting and unmuting the mic must not make room noise look like speech
+        "room_noise_after_mute": (speech_share([room(2), silence(1), room(20)], 2), (0.0, 0.05)),
+        "tone_after_mute": (speech_share([room(2), silence(1), room(2), tone(3, -20) + room(3)], 3), (0.95, 1.0)),
+        # A hum that never stops becomes the floor after steady_s
+        "hum_after_steady_s": (speech_share([room(2), tone(32, -30, freq=60) + room(32), tone(5, -30, freq=60) + room(5)], 2),
+                               (0.0, 0.05)),
+    }
+
+def main():
+    failures = []
+    for name, (share, (low, high)) in scenarios().items():
+        ok = low <= share <= high
+        if not ok:
+            failures.append(name)
+        print(f"{name:<24} speech {share:6.1%}  expected {low:.0%}-{high:.0%}  {'ok' if ok else 'FAIL'}")
+    if failures:
+        print(f"\nFAIL: {', '.join(failures)}")
+        sys.exit(1)
+    print("\nOK")
+
+if __name__ == "__main__":
+    main()
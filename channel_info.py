@@ -0,0 +1,150 @@
+import asyncio
+import json
+import os
+from clients import request_with_retries
+from settings import settings
+
+config = settings.config
+
+HELIX_URL = "https://api.twitch.tv/helix"
+
+info_config = config['twitch'].get('channel_info', {})
+MIN_INTERVAL = info_config.get('min_interval', 30)      # seconds, after a change or going live
+MAX_INTERVAL = info_config.get('max_interval', 600)     # seconds, once nothing has changed for a while
+# While offline, keep polling often enough to notice the stream starting
+OFFLINE_MAX_INTERVAL = info_config.get('offline_max_interval', 60)
+BACKOFF_FACTOR = info_config.get('backoff_factor', 1.5)
+
+cache_dir = config['paths'].get('cache_dir', 'cache')
+BROADCASTER_CACHE_FILE = os.path.join(cache_dir, 'broadcaster_ids.json')
+
+def _load_broadcaster_ids():
+    try:
+        with open(BROADCASTER_CACHE_FILE, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _save_broadcaster_ids(ids):
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(BROADCASTER_CACHE_FILE, 'w') as f:
+        json.dump(ids, f, indent=2)
+
+class ChannelInfoService:
+    """
+    Keeps the channel's title and game up to date.
+
+    The broadcaster id is resolved once and cached on disk, so each poll is a
+    /helix/channels call plus a /helix/streams call. Updates are only pushed to
+    chat_queue when the title or game actually changed. Polling is fast after
+    a change and whenever the stream goes live (the streamer usually sets
+    title/game around then), and slows down while nothing changes.
+    """
+
+    def __init__(self, channel_name, chat_queue, client_id, oauth_token, refresh_token):
+        """
+        Args:
+            channel_name (str): Twitch login of the channel.
+            chat_queue (asyncio.Queue): Receives (channel, "__channel_info__", (title, game)).
+            client_id (str): Twitch application client id.
+            oauth_token (str): Current app access token.
+            refresh_token (coroutine function): Called with the rejected token;
+                fetches and saves a new one, returning it (or None on failure).
+        """
+        self.channel_name = channel_name.lower()
+        self.chat_queue = chat_queue
+        self.client_id = client_id
+        self.oauth_token = oauth_token
+        self.refresh_token = refresh_token
+        self.broadcaster_id = _load_broadcaster_ids().get(self.channel_name)
+        self.title = None
+        self.game = None
+        self.live_since = None  # started_at of the current stream, None while offline
+        self.interval = MIN_INTERVAL
+
+    def _headers(self):
+        return {
+            'Client-ID': self.client_id,
+            'Authorization': f'Bearer {self.oauth_token}'
+        }
+
+    async def _get(self, url):
+        """GET a Helix URL, refreshing the app token once if Twitch rejects it."""
+        status, data = await request_with_retries("GET", url, headers=self._headers())
+        if status == 401:
+            print("[CHANNEL INFO] Twitch OAuth token expired or invalid, requesting a new one...")
+            new_token = await self.refresh_token(self.oauth_token)
+            if not new_token:
+                return status, data
+            self.oauth_token = new_token
+            status, data = await request_with_retries("GET", url, headers=self._headers())
+        return status, data
+
+    async def _resolve_broadcaster_id(self):
+        status, data = await self._get(f"{HELIX_URL}/users?login={self.channel_name}")
+        if status != 200 or not data or not data.get('data'):
+            print(f"Could not find broadcaster ID for {self.channel_name}")
+            return None
+
+        broadcaster_id = data['data'][0]['id']
+        ids = _load_broadcaster_ids()
+        ids[self.channel_name] = broadcaster_id
+        _save_broadcaster_ids(ids)
+        return broadcaster_id
+
+    async def _poll_stream(self):
+        """Update live_since from /helix/streams. Returns True if a new stream started."""
+        status, data = await self._get(f"{HELIX_URL}/streams?user_id={self.broadcaster_id}")
+        if status != 200 or not data:
+            return False
+        streams = data.get('data') or []
+        live_since = streams[0].get('started_at') if streams else None
+        went_live = live_since is not None and live_since != self.live_since
+        if went_live:
+            print(f"[CHANNEL INFO] {self.channel_name} went live at {live_since}")
+        self.live_since = live_since
+        return went_live
+
+    async def poll_once(self):
+        """Fetch title/game once. Returns True if they changed or the stream just went live."""
+        if not self.broadcaster_id:
+            self.broadcaster_id = await self._resolve_broadcaster_id()
+            if not self.broadcaster_id:
+                return False
+
+        went_live = await self._poll_stream()
+
+        status, data = await self._get(f"{HELIX_URL}/channels?broadcaster_id={self.broadcaster_id}")
+        if status != 200 or not data:
+            print(f"Error fetching channel info (HTTP {status})")
+            return went_live
+        if not data.get('data'):
+            # Cached id no longer matches a channel; look it up again next time
+            self.broadcaster_id = None
+            return False
+
+        channel_info = data['data'][0]
+        title = channel_info.get('title', '')
+        game_name = channel_info.get('game_name', '')
+        if (title, game_name) == (self.title, self.game):
+            return went_live
+
+        self.title, self.game = title, game_name
+        await self.chat_queue.put((self.channel_name, "__channel_info__", (title, game_name)))
+        return True
+
+    async def run(self):
+        while True:
+            try:
+                changed = await self.poll_once()
+            except Exception as e:
+                print(f"Error fetching channel info: {e}")
+                changed = False
+
+            # Poll quickly after a change or going live, back off while things stay the same
+            if changed:
+                self.interval = MIN_INTERVAL
+            else:
+                max_interval = MAX_INTERVAL if self.live_since else min(OFFLINE_MAX_INTERVAL, MAX_INTERVAL)
+                self.interval = min(self.interval * BACKOFF_FACTOR, max_interval)
+            await asyncio.sleep(self.interval)
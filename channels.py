@@ -0,0 +1,211 @@
+"""
+Per-channel settings and state for single- and multi-channel mode.
+
+By default the bot serves config['twitch']['channel_name'] exactly as before.
+Listing several channels under config['twitch']['channels'] lets one process
+serve all of them over a single IRC connection; each entry can override the
+AI name, prompt file, voice settings and playback target:
+
+    "channels": [
+        "msvosch",
+        {"name": "otherstreamer", "ai_name": "Nova", "prompt": "nova-prompt.txt",
+         "voice": {"elevenlabs": {"voice_id": "..."}}, "playback": "overlay"}
+    ]
+"""
+import copy
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from queue import Empty
+from settings import settings
+
+config = settings.config
+
+# How many unanswered mentions we keep per channel (oldest are dropped)
+MAX_PENDING_MENTIONS = 5
+
+room_config = config['gpt'].get('room_context', {})
+
+def estimate_tokens(text):
+    """Rough token count for English chat (about 4 characters per token)."""
+    return len(text) // 4 + 1
+
+class RoomContext:
+    """
+    The last 'capacity' chat lines of a channel, rendered for the prompt.
+
+    Token counts are estimated once per line when it arrives. Every line gets
+    a sequence number, so a reply can render the room as it was just before
+    the message it answers (which the prompt already quotes). Each reply
+    answers a different message and so asks for a different view, which is
+    why render() isn't cached.
+    """
+
+    def __init__(self, capacity=50, max_tokens=300):
+        self.lines = deque(maxlen=capacity)  # (line, tokens)
+        self.max_tokens = max_tokens
+        self._last_seq = 0  # sequence number of the newest line
+        self._lock = threading.Lock()
+
+    def add(self, username, message):
+        """Append a chat line; returns its sequence number."""
+        line = f"{username}: {message}"
+        with self._lock:
+            self.lines.append((line, estimate_tokens(line)))
+            self._last_seq += 1
+            return self._last_seq
+
+    def render(self, max_tokens=None, before=None):
+        """
+        Recent chat as "user: message" lines, capped at max_tokens (default:
+        self.max_tokens). With 'before' (a sequence number from add()), only
+        lines older than that one are included.
+        """
+        max_tokens = self.max_tokens if max_tokens is None else max_tokens
+        with self._lock:
+            first_seq = self._last_seq - len(self.lines) + 1
+            end_seq = self._last_seq + 1 if before is None else max(first_seq, min(before, self._last_seq + 1))
+            picked = []
+            budget = max_tokens
+            for index in range(end_seq - first_seq - 1, -1, -1):
+                line, tokens = self.lines[index]
+                if tokens > budget:
+                    break
+                picked.append(line)
+                budget -= tokens
+            return "\n".join(reversed(picked))
+
+@dataclass
+class Channel:
+    name: str
+    ai_name: str
+    prompt_path: str
+    history_dir: str
+    voice: dict
+    # "local": played through this machine's speakers (pygame)
+    # "overlay": played by the channel's browser source
+    playback: str = "local"
+    title: str = None
+    game: str = None
+    # Clips waiting to be played for this channel (see main.process_audio_queue)
+    clips: deque = field(default_factory=deque)
+    clip_ends_at: float = 0.0
+    # Recent chat of the whole room, given to the model as context (see RoomContext)
+    room: RoomContext = field(default_factory=RoomContext)
+
+    def mentions_ai(self, message):
+        """Case-insensitive check for the AI's name in a chat message."""
+        return self.ai_name.lower() in message.lower()
+
+def _merge(base, overrides):
+    merged = copy.deepcopy(base)
+    for key, value in overrides.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = _merge(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+def load_channels(config):
+    """Build the Channel objects described by config, keyed by channel name."""
+    entries = config['twitch'].get('channels') or [config['twitch']['channel_name']]
+    multi_channel = len(entries) > 1
+    data_dir = config['user_history']['data_dir']
+
+    channels = OrderedDict()
+    for index, entry in enumerate(entries):
+        if isinstance(entry, str):
+            entry = {"name": entry}
+        name = entry['name'].lower()
+        channels[name] = Channel(
+            name=name,
+            ai_name=entry.get('ai_name', config['gpt'].get('ai_name', 'assistant')),
+            prompt_path=entry.get('prompt', config['paths']['prompt']),
+            # Keep the original layout for a single channel so existing history still loads
+            history_dir=os.path.join(data_dir, name) if multi_channel else data_dir,
+            voice=_merge(config['voice'], entry.get('voice', {})),
+            # Only one channel can own the local speakers; the rest default to their overlay
+            playback=entry.get('playback', "local" if index == 0 else "overlay"),
+            room=RoomContext(room_config.get('lines', 50), room_config.get('max_tokens', 300)),
+        )
+    return channels
+
+CHANNELS = load_channels(config)
+
+def get_channel(name=None):
+    """The named channel, or the first configured one when name is None."""
+    if name is None:
+        return next(iter(CHANNELS.values()))
+    return CHANNELS[name.lower()]
+
+class FairQueue:
+    """
+    Thread-safe queue that hands out items round-robin across keys (channels),
+    so one busy channel can't starve the others. Each key can be capped, in
+    which case its oldest item is dropped.
+
+    A key has at most one item in flight: after get_nowait() hands out an
+    item, that key is skipped until task_done(key). Workers therefore run in
+    parallel only across channels, and each channel's replies keep their order.
+    """
+
+    def __init__(self, max_per_key=None):
+        self.max_per_key = max_per_key
+        self._lock = threading.Lock()
+        self._queues = OrderedDict()
+        self._in_flight = set()
+
+    def put(self, key, item, queued_at=None):
+        with self._lock:
+            queue = self._queues.get(key)
+            if queue is None:
+                queue = self._queues[key] = deque(maxlen=self.max_per_key)
+            # Enqueue time travels with the item, so snapshots can drop stale ones
+            queue.append((queued_at or time.time(), item))
+
+    def get_nowait(self):
+        """
+        Return (key, item) from the next key in turn that has nothing in
+        flight; raises queue.Empty. Call task_done(key) once the item is handled.
+        """
+        with self._lock:
+            for key, queue in self._queues.items():
+                if queue and key not in self._in_flight:
+                    _, item = queue.popleft()
+                    self._in_flight.add(key)
+                    # This key goes to the back of the line
+                    self._queues.move_to_end(key)
+                    return key, item
+        raise Empty
+
+    def task_done(self, key):
+        """Let 'key' hand out its next item."""
+        with self._lock:
+            self._in_flight.discard(key)
+
+    def snapshot(self):
+        """{key: [(queued_at, item), ...]} of everything waiting, oldest first."""
+        with self._lock:
+            return {key: list(queue) for key, queue in self._queues.items() if queue}
+
+    def restore(self, entries, max_age):
+        """Re-queue snapshot() entries that are younger than max_age seconds; returns how many."""
+        cutoff = time.time() - max_age
+        restored = 0
+        for key, items in entries.items():
+            for queued_at, item in items:
+                if queued_at >= cutoff:
+                    self.put(key, item, queued_at)
+                    restored += 1
+        return restored
+
+    def qsize(self, key=None):
+        with self._lock:
+            if key is not None:
+                return len(self._queues.get(key, ()))
+            return sum(len(queue) for queue in self._queues.values())
+
+    def empty(self):
+        return self.qsize() == 0
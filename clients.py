@@ -0,0 +1,222 @@
+"""
+Shared HTTP clients for every provider the bot talks to.
+
+Each provider gets one pooled keep-alive client (HTTP/2 when the 'h2' package
+is installed) that every module reuses, instead of each module building its
+own. keep_connections_warm() opens the TLS connections at startup and keeps
+them alive, so the first request after boot or a quiet spell doesn't pay for
+DNS and the TLS handshake.
+
+Every client has exactly one retry layer, so a failing provider costs at
+most MAX_RETRIES + 1 attempts:
+
+    OpenAI       the SDK's own retries (max_retries)
+    ElevenLabs   with_retries() around each call
+    Twitch       request_with_retries()
+
+The httpx transports underneath don't retry on their own.
+"""
+import asyncio
+import random
+import threading
+import time
+import httpx
+import aiohttp
+from settings import settings
+
+http_config = settings.config.get('http', {})
+CONNECT_TIMEOUT = http_config.get('connect_timeout', 5)
+READ_TIMEOUT = http_config.get('read_timeout', 30)
+MAX_RETRIES = http_config.get('max_retries', 3)
+BACKOFF_BASE = http_config.get('backoff_base', 0.5)
+BACKOFF_MAX = http_config.get('backoff_max', 8)
+KEEPALIVE_EXPIRY = http_config.get('keepalive_expiry', 120)
+PREWARM_INTERVAL = http_config.get('prewarm_interval', 60)
+MAX_CONNECTIONS = http_config.get('max_connections', 10)
+
+# Hosts we pre-warm for each provider
+PROVIDER_URLS = {
+    "openai": "https://api.openai.com/v1",
+    "elevenlabs": "https://api.elevenlabs.io/v1",
+    "twitch": "https://api.twitch.tv/helix",
+    "twitch_id": "https://id.twitch.tv/oauth2",
+}
+
+# Providers reached through the aiohttp session rather than httpx
+ASYNC_PROVIDERS = {"twitch", "twitch_id"}
+
+# Responses worth retrying: rate limits and server-side errors
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+_lock = threading.Lock()
+_http_clients = {}
+_sdk_clients = {}
+_aiohttp_session = None
+
+def _http2_enabled():
+    if not http_config.get('http2', True):
+        return False
+    try:
+        import h2  # noqa: F401  (httpx needs it for HTTP/2)
+        return True
+    except ImportError:
+        return False
+
+def backoff_delay(attempt, base=BACKOFF_BASE, cap=BACKOFF_MAX):
+    """Exponential backoff with full jitter for retry number 'attempt' (0-based)."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+def with_retries(func, *args, retries=MAX_RETRIES, **kwargs):
+    """
+    Call func(*args, **kwargs), retrying transport errors and retryable HTTP
+    statuses with jittered backoff. Blocking; for use off the event loop or in
+    code that is already synchronous.
+    """
+    for attempt in range(retries + 1):
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            status = getattr(e, "status_code", None) or getattr(getattr(e, "response", None), "status_code", None)
+            retryable = isinstance(e, httpx.TransportError) or status in RETRY_STATUSES
+            if not retryable or attempt == retries:
+                raise
+            time.sleep(backoff_delay(attempt))
+
+def get_http_client(provider):
+    """Pooled, keep-alive httpx client for 'provider' (created on first use)."""
+    with _lock:
+        client = _http_clients.get(provider)
+        if client is None:
+            http2 = _http2_enabled()
+            limits = httpx.Limits(
+                max_connections=MAX_CONNECTIONS,
+                max_keepalive_connections=MAX_CONNECTIONS,
+                keepalive_expiry=KEEPALIVE_EXPIRY
+            )
+            client = httpx.Client(
+                http2=http2,
+                timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+                # No transport-level retries: each provider retries in exactly one place (see above)
+                transport=httpx.HTTPTransport(http2=http2, limits=limits)
+            )
+            _http_clients[provider] = client
+        return client
+
+def get_openai_client():
+    """Shared OpenAI client (chat, TTS and Whisper)."""
+    with _lock:
+        client = _sdk_clients.get("openai")
+    if client is None:
+        from openai import OpenAI
+        client = OpenAI(
+            api_key=settings.secret("openAI"),
+            http_client=get_http_client("openai"),
+            max_retries=MAX_RETRIES,  # the only retry layer for OpenAI; the SDK backs off with jitter
+            timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT)
+        )
+        with _lock:
+            client = _sdk_clients.setdefault("openai", client)
+    return client
+
+def get_elevenlabs_client():
+    """Shared ElevenLabs client."""
+    with _lock:
+        client = _sdk_clients.get("elevenlabs")
+    if client is None:
+        from elevenlabs import ElevenLabs
+        # Not retried by the SDK; callers wrap requests in with_retries()
+        client = ElevenLabs(
+            api_key=settings.secret("elevenlabs"),
+            httpx_client=get_http_client("elevenlabs"),
+            timeout=READ_TIMEOUT
+        )
+        with _lock:
+            client = _sdk_clients.setdefault("elevenlabs", client)
+    return client
+
+def get_aiohttp_session():
+    """
+    Shared aiohttp session for the Twitch API. Must be called from the event
+    loop; the connector keeps connections alive and caches DNS lookups.
+    """
+    global _aiohttp_session
+    if _aiohttp_session is None or _aiohttp_session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=MAX_CONNECTIONS,
+            ttl_dns_cache=300,
+            keepalive_timeout=KEEPALIVE_EXPIRY
+        )
+        _aiohttp_session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(connect=CONNECT_TIMEOUT, sock_read=READ_TIMEOUT)
+        )
+    return _aiohttp_session
+
+async def request_with_retries(method, url, retries=MAX_RETRIES, **kwargs):
+    """
+    Make a request on the shared aiohttp session, retrying connection errors
+    and retryable statuses with jittered backoff.
+    Returns (status, json_body); json_body is None for non-JSON responses.
+    """
+    session = get_aiohttp_session()
+    for attempt in range(retries + 1):
+        try:
+            async with session.request(method, url, **kwargs) as resp:
+                if resp.status in RETRY_STATUSES and attempt < retries:
+                    await asyncio.sleep(backoff_delay(attempt))
+                    continue
+                try:
+                    body = await resp.json()
+                except (aiohttp.ContentTypeError, ValueError):
+                    body = None
+                return resp.status, body
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+            if attempt == retries:
+                raise
+            await asyncio.sleep(backoff_delay(attempt))
+
+def prewarm(providers):
+    """
+    Open (or refresh) a pooled connection to each provider's API host.
+    The response itself doesn't matter; only the TLS connection does.
+    """
+    for provider in providers:
+        try:
+            get_http_client(provider).head(PROVIDER_URLS[provider])
+        except Exception as e:
+            print(f"Could not pre-warm connection to {provider}: {e}")
+
+async def _prewarm_async(provider):
+    try:
+        async with get_aiohttp_session().head(PROVIDER_URLS[provider]):
+            pass
+    except Exception as e:
+        print(f"Could not pre-warm connection to {provider}: {e}")
+
+async def keep_connections_warm(providers):
+    """
+    Pre-warm connections at startup, then refresh them every PREWARM_INTERVAL
+    seconds so they survive idle stretches.
+    """
+    sync_providers = [p for p in providers if p not in ASYNC_PROVIDERS]
+    loop = asyncio.get_running_loop()
+    while True:
+        await loop.run_in_executor(None, prewarm, sync_providers)
+        for provider in providers:
+            if provider in ASYNC_PROVIDERS:
+                await _prewarm_async(provider)
+        if not PREWARM_INTERVAL:
+            return
+        await asyncio.sleep(PREWARM_INTERVAL)
+
+async def close_clients():
+    """Close every pooled connection (call on shutdown)."""
+    global _aiohttp_session
+    with _lock:
+        for client in _http_clients.values():
+            client.close()
+        _http_clients.clear()
+        _sdk_clients.clear()
+    if _aiohttp_session is not None:
+        await _aiohttp_session.close()
+        _aiohttp_session = None
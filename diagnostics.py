@@ -0,0 +1,346 @@
+"""
+Runtime diagnostics served under /admin/ on the avatar server.
+
+    GET  /admin                   overview: tasks, threads, loop lag, queues, memory
+    GET  /admin/profile           sample every thread's stack (?seconds=5&interval_ms=5);
+                                  ?format=collapsed gives flamegraph/speedscope input
+    GET  /admin/tasks             asyncio tasks grouped by coroutine (?stacks=1 for stacks)
+    GET  /admin/loop              event-loop lag histogram and recent stalls
+    GET  /admin/queues            sizes of the registered queues
+    POST /admin/memory/start      start tracemalloc (?frames=10)
+    GET  /admin/memory/snapshot   top allocations and the diff since the last snapshot
+    POST /admin/memory/stop       stop tracemalloc
+
+Requests must come from this machine, or carry avatar.admin.token as
+?token= or an X-Admin-Token header when one is configured.
+
+The loop monitor measures how late a periodic sleep wakes up. A watchdog
+thread notices when the loop has not woken up for stall_ms and records
+what the loop thread was running at that moment, which points at the
+blocking callback.
+"""
+import asyncio
+import hmac
+import json
+import math
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, deque
+from aiohttp import web
+
+# Queue name -> callable returning its current size (see register_queue)
+_queue_probes = {}
+
+def register_queue(name, qsize):
+    """Make a queue's size visible under /admin/queues."""
+    _queue_probes[name] = qsize
+
+def queue_sizes():
+    sizes = {}
+    for name, qsize in _queue_probes.items():
+        try:
+            sizes[name] = qsize()
+        except Exception as e:  # e.g. qsize() is not implemented for mp queues on macOS
+            sizes[name] = f"error: {e}"
+    return sizes
+
+def _frame_stack(frame, max_depth=64, lines=True):
+    """Outermost-first list of "file:function[:line]" for a frame."""
+    stack = []
+    while frame is not None and len(stack) < max_depth:
+        code = frame.f_code
+        entry = f"{os.path.basename(code.co_filename)}:{code.co_name}"
+        stack.append(f"{entry}:{frame.f_lineno}" if lines else entry)
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+###############################################################################
+# Sampling profiler
+###############################################################################
+def sample_stacks(seconds=5.0, interval=0.005):
+    """
+    Sample the stack of every other thread for 'seconds'.
+    Returns (samples, Counter of (thread name, stack tuple) -> hits).
+    """
+    me = threading.get_ident()
+    stacks = Counter()
+    samples = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident != me:
+                stacks[(names.get(ident, str(ident)), tuple(_frame_stack(frame, lines=False)))] += 1
+        samples += 1
+        time.sleep(interval)
+    return samples, stacks
+
+def profile_report(samples, stacks, top=15):
+    """Per thread: the functions on top of the stack most often, and the hottest stacks."""
+    threads = {}
+    for (thread, stack), hits in stacks.items():
+        entry = threads.setdefault(thread, {"samples": 0, "leaf": Counter(), "stacks": Counter()})
+        entry["samples"] += hits
+        entry["leaf"][stack[-1] if stack else "?"] += hits
+        entry["stacks"][" > ".join(stack[-8:])] += hits
+
+    report = {"samples": samples, "threads": {}}
+    for thread, entry in sorted(threads.items(), key=lambda item: item[0]):
+        report["threads"][thread] = {
+            "top_functions": [{"function": name, "share": round(hits / samples, 3)}
+                              for name, hits in entry["leaf"].most_common(top)],
+            "top_stacks": [{"stack": stack, "share": round(hits / samples, 3)}
+                           for stack, hits in entry["stacks"].most_common(top)],
+        }
+    return report
+
+def collapsed_stacks(stacks):
+    """Brendan Gregg's collapsed format, one "thread;outer;...;inner count" line per stack."""
+    return "\n".join(f"{';'.join((thread,) + stack)} {hits}"
+                     for (thread, stack), hits in stacks.most_common()) + "\n"
+
+###############################################################################
+# Event-loop lag
+###############################################################################
+class LoopMonitor:
+    BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 5000)
+
+    def __init__(self, interval=0.1, stall_ms=250, keep_stalls=20):
+        self.interval = interval
+        self.stall_s = stall_ms / 1000
+        self.histogram = [0] * (len(self.BUCKETS_MS) + 1)
+        self.ticks = 0
+        self.max_lag_ms = 0.0
+        self.total_lag_ms = 0.0
+        self.stalls = deque(maxlen=keep_stalls)
+        self.stall_count = 0
+        self._last_tick = time.perf_counter()
+        self._loop_thread = None
+        self._in_stall = False
+
+    async def run(self):
+        self._loop_thread = threading.get_ident()
+        threading.Thread(target=self._watchdog, name="loop-watchdog", daemon=True).start()
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self._last_tick = now = time.perf_counter()
+            self._record(max(0.0, (now - started - self.interval) * 1000))
+
+    def _record(self, lag_ms):
+        self.ticks += 1
+        self.total_lag_ms += lag_ms
+        self.max_lag_ms = max(self.max_lag_ms, lag_ms)
+        for index, bound in enumerate(self.BUCKETS_MS):
+            if lag_ms <= bound:
+                self.histogram[index] += 1
+                break
+        else:
+            self.histogram[-1] += 1
+
+    def _watchdog(self):
+        while True:
+            time.sleep(self.stall_s / 2)
+            late = time.perf_counter() - self._last_tick - self.interval
+            if late < self.stall_s:
+                self._in_stall = False
+                continue
+            if self._in_stall:
+                continue
+            # The loop is stuck right now: record what it is running
+            self._in_stall = True
+            self.stall_count += 1
+            frame = sys._current_frames().get(self._loop_thread)
+            self.stalls.append({
+                "at": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "blocked_ms": round(late * 1000),
+                "stack": _frame_stack(frame, max_depth=20) if frame is not None else [],
+            })
+
+    def report(self):
+        labels = [f"<={bound}ms" for bound in self.BUCKETS_MS] + [f">{self.BUCKETS_MS[-1]}ms"]
+        return {
+            "ticks": self.ticks,
+            "mean_lag_ms": round(self.total_lag_ms / self.ticks, 2) if self.ticks else None,
+            "max_lag_ms": round(self.max_lag_ms, 1),
+            "histogram": dict(zip(labels, self.histogram)),
+            "stalls": self.stall_count,
+            "recent_stalls": list(self.stalls),
+        }
+
+###############################################################################
+# tracemalloc
+###############################################################################
+class MemoryTracker:
+    FILTERS = (
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+        tracemalloc.Filter(False, "<unknown>"),
+    )
+
+    def __init__(self):
+        self._last = None
+        self._lock = threading.Lock()
+
+    def start(self, frames=10):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+            self._last = None
+        return self.status()
+
+    def stop(self):
+        tracemalloc.stop()
+        self._last = None
+        return self.status()
+
+    def status(self):
+        if not tracemalloc.is_tracing():
+            return {"tracing": False}
+        current, peak = tracemalloc.get_traced_memory()
+        return {"tracing": True, "traced_mb": round(current / 2**20, 2), "peak_mb": round(peak / 2**20, 2),
+                "frames": tracemalloc.get_traceback_limit()}
+
+    def snapshot(self, limit=20, key_type="lineno"):
+        """Top allocations now, and the biggest changes since the previous snapshot."""
+        if not tracemalloc.is_tracing():
+            return {"tracing": False}
+        with self._lock:
+            snapshot = tracemalloc.take_snapshot().filter_traces(self.FILTERS)
+            previous, self._last = self._last, snapshot
+
+        def describe(stat, diff=False):
+            entry = {"where": str(stat.traceback[0]) if stat.traceback else "?",
+                     "size_kb": round(stat.size / 1024, 1), "count": stat.count}
+            if diff:
+                entry.update(size_diff_kb=round(stat.size_diff / 1024, 1), count_diff=stat.count_diff)
+            return entry
+
+        result = dict(self.status(), top=[describe(stat) for stat in snapshot.statistics(key_type)[:limit]])
+        if previous is not None:
+            result["diff"] = [describe(stat, diff=True) for stat in snapshot.compare_to(previous, key_type)[:limit]]
+        return result
+
+loop_monitor = None
+memory_tracker = MemoryTracker()
+
+def start_monitoring(interval=0.1, stall_ms=250):
+    """Start the loop-lag monitor on the running loop; returns its task."""
+    global loop_monitor
+    loop_monitor = LoopMonitor(interval, stall_ms)
+    return asyncio.get_running_loop().create_task(loop_monitor.run(), name="loop-monitor")
+
+###############################################################################
+# HTTP handlers
+###############################################################################
+def _task_name(task):
+    coro = task.get_coro()
+    return getattr(coro, "__qualname__", None) or type(coro).__name__
+
+def task_summary(stacks=False):
+    tasks = asyncio.all_tasks()
+    counts = Counter(_task_name(task) for task in tasks)
+    summary = {"total": len(tasks), "by_coroutine": dict(counts.most_common())}
+    if stacks:
+        summary["stacks"] = [{"task": task.get_name(), "coroutine": _task_name(task),
+                              "stack": [f"{os.path.basename(frame.f_code.co_filename)}:"
+                                        f"{frame.f_code.co_name}:{frame.f_lineno}"
+                                        for frame in task.get_stack(limit=8)]}
+                             for task in tasks]
+    return summary
+
+def _authorized(request):
+    token = request.app["admin_token"]
+    if token:
+        supplied = request.query.get("token") or request.headers.get("X-Admin-Token", "")
+        return hmac.compare_digest(supplied, token)
+    return request.remote in ("127.0.0.1", "::1")
+
+def _admin(handler):
+    async def guarded(request):
+        if not _authorized(request):
+            raise web.HTTPForbidden()
+        return await handler(request)
+    return guarded
+
+def _json(data):
+    return web.json_response(data, headers={"Cache-Control": "no-store"},
+                             dumps=lambda value: json.dumps(value, indent=2, default=str))
+
+def _query_number(request, name, default, cast=int, minimum=None, maximum=None):
+    """A numeric query parameter, clamped to [minimum, maximum]; 400 if it isn't a number."""
+    raw = request.query.get(name)
+    if raw is None:
+        return default
+    try:
+        value = cast(raw)
+    except ValueError:
+        raise web.HTTPBadRequest(text=f"{name} must be a number")
+    if not math.isfinite(value):
+        raise web.HTTPBadRequest(text=f"{name} must be a finite number")
+    if minimum is not None:
+        value = max(value, minimum)
+    if maximum is not None:
+        value = min(value, maximum)
+    return value
+
+async def admin_index(request):
+    from supervisor import process_usage
+    cpu_seconds, rss = process_usage()
+    return _json({
+        "pid": os.getpid(),
+        "cpu_seconds": cpu_seconds,
+        "rss_mb": round(rss / 2**20, 1) if rss else None,
+        "threads": sorted(thread.name for thread in threading.enumerate()),
+        "tasks": task_summary(),
+        "loop": loop_monitor.report() if loop_monitor else None,
+        "queues": queue_sizes(),
+        "memory": memory_tracker.status(),
+    })
+
+async def admin_profile(request):
+    seconds = _query_number(request, "seconds", 5, float, minimum=0.1, maximum=60)
+    interval = _query_number(request, "interval_ms", 5, float, minimum=1) / 1000
+    # Sampling runs in a worker thread, so the event loop shows up in the profile as it really runs
+    samples, stacks = await asyncio.to_thread(sample_stacks, seconds, interval)
+    if request.query.get("format") == "collapsed":
+        return web.Response(text=collapsed_stacks(stacks), content_type="text/plain")
+    return _json(profile_report(samples, stacks, top=_query_number(request, "top", 15, minimum=1)))
+
+async def admin_tasks(request):
+    return _json(task_summary(stacks=request.query.get("stacks") == "1"))
+
+async def admin_loop(request):
+    return _json(loop_monitor.report() if loop_monitor else {"running": False})
+
+async def admin_queues(request):
+    return _json(queue_sizes())
+
+async def admin_memory_start(request):
+    return _json(memory_tracker.start(_query_number(request, "frames", 10, minimum=1)))
+
+async def admin_memory_stop(request):
+    return _json(memory_tracker.stop())
+
+async def admin_memory_snapshot(request):
+    limit = _query_number(request, "limit", 20, minimum=1)
+    key_type = request.query.get("key", "lineno")
+    if key_type not in ("lineno", "filename", "traceback"):
+        raise web.HTTPBadRequest(text="key must be lineno, filename or traceback")
+    # Taking a snapshot walks every traced block; don't stall the loop for it
+    return _json(await asyncio.to_thread(memory_tracker.snapshot, limit, key_type))
+
+def add_admin_routes(app, token=""):
+    app["admin_token"] = token
+    app.router.add_get("/admin", _admin(admin_index))
+    app.router.add_get("/admin/profile", _admin(admin_profile))
+    app.router.add_get("/admin/tasks", _admin(admin_tasks))
+    app.router.add_get("/admin/loop", _admin(admin_loop))
+    app.router.add_get("/admin/queues", _admin(admin_queues))
+    app.router.add_post("/admin/memory/start", _admin(admin_memory_start))
+    app.router.add_post("/admin/memory/stop", _admin(admin_memory_stop))
+    app.router.add_get("/admin/memory/snapshot", _admin(admin_memory_snapshot))
@@ -1,38 +1,30 @@
 import json
 import logging
 import os
-from openai import OpenAI
+import threading
+import time
+from collections import defaultdict
+from clients import get_openai_client
+from channels import get_channel
+from load_control import load_controller
+from settings import settings
+from logging_setup import payload
 from response_formatter import format_openai_response
 from datetime import datetime
 
-# Load config
-with open('config.json') as f:
-    config = json.load(f)
+config = settings.config
 
 logger = logging.getLogger("my_app.gpt")
 logger.setLevel(logging.INFO)
 #logger.propagate = False
 
-try:
-    with open('SECRETS.json') as f:
-        secrets = json.load(f)
-        auth_token = secrets["openAI"]["authToken"]
-except FileNotFoundError:
-    raise FileNotFoundError("The SECRETS.json file was not found.")
-except KeyError as e:
-    raise KeyError(f"Key {e} not found in the SECRETS.json file.")
-except json.JSONDecodeError:
-    raise ValueError("The SECRETS.json file is not a valid JSON.")
-
-client = OpenAI(api_key=auth_token)
-
-streamer = config['twitch']['channel_name']
-AI_name = config['gpt']['ai_name']
-
 data_dir = config['user_history']['data_dir']
 max_messages = config['user_history']['max_messages']
 
-def save_message(username, message_type, content, ai_name=None):
+# One lock per history file, so concurrent workers never interleave a user's read/write
+_history_locks = defaultdict(threading.Lock)
+
+def save_message(username, message_type, content, ai_name=None, history_dir=None):
     """
     Saves a message (user or AI) to the user's JSON file and enforces the max message limit.
     User messages are used to check the limit; AI messages are paired with the user messages.
@@ -42,10 +34,12 @@ def save_message(username, message_type, content, ai_name=None):
         message_type (str): Either "user" or "ai".
         content (str): The message content.
         ai_name (str): The AI's name (for storing AI responses).
+        history_dir (str): Directory holding the history files (defaults to data_dir).
     """
+    history_dir = history_dir or data_dir
     # Ensure data directory exists
-    os.makedirs(data_dir, exist_ok=True)
-    user_file = os.path.join(data_dir, f"{username}.json")
+    os.makedirs(history_dir, exist_ok=True)
+    user_file = os.path.join(history_dir, f"{username}.json")
     
     # Load existing history or create a new structure
     if os.path.exists(user_file):
@@ -78,17 +72,18 @@ def save_message(username, message_type, content, ai_name=None):
     with open(user_file, "w", encoding="utf-8") as f:
         json.dump(user_data, f, indent=4, ensure_ascii=False)
 
-def read_user_history(username):
+def read_user_history(username, history_dir=None):
     """
     Reads the user's message history from their JSON file and formats it for the OpenAI API.
 
     Args:
         username (str): The user's name.
+        history_dir (str): Directory holding the history files (defaults to data_dir).
 
     Returns:
         list: A list of formatted messages (role: user/assistant, content: message).
     """
-    user_file = os.path.join(data_dir, f"{username}.json")
+    user_file = os.path.join(history_dir or data_dir, f"{username}.json")
 
     if os.path.exists(user_file):
         with open(user_file, "r") as f:
@@ -100,15 +95,37 @@ def read_user_history(username):
     else:
         return []
 
-def send_to_openai(title, game, username, message):
+def send_to_openai(title, game, username, message, channel=None, room_before=None):
+    """
+    Ask the model for a reply to 'message' from 'username'.
+    'channel' (channels.Channel) selects the streamer, AI name, prompt and
+    history namespace; it defaults to the first configured channel.
+    'room_before' is the message's sequence number in channel.room, so the
+    room context stops just before it; None includes all recent chat.
+    """
+    channel = channel or get_channel()
+    with _history_locks[(channel.history_dir, username)]:
+        return _send_to_openai(title, game, username, message, channel, room_before)
+
+def _send_to_openai(title, game, username, message, channel, room_before=None):
+    streamer = channel.name
+    AI_name = channel.ai_name
     message = message.replace("\n", " ").strip()
-    logger.info(f"Received following message from {username}: {message}")
+    logger.info("Received following message from %s: %s", username, message)
     
-    # Fetch the current user history
-    user_context = read_user_history(username)
-    logger.info(f"User context: {user_context}")
+    # Generation settings for the current load (see load_control.py)
+    profile = load_controller.profile()
+
+    # Fetch the current user history, shortened when the bot is falling behind
+    user_context = read_user_history(username, channel.history_dir)
+    if profile['history_messages'] is not None:
+        user_context = user_context[-profile['history_messages']:] if profile['history_messages'] else []
+    logger.info("User context: %s", payload(user_context))
+
+    # What the rest of chat has been saying (cached between replies until new lines arrive)
+    room_context = channel.room.render(profile['room_tokens'], before=room_before)
     
-    prompt_path = config['paths']['prompt']
+    prompt_path = channel.prompt_path
     
     # Check if prompt file exists, create if not
     if not os.path.exists(prompt_path):
@@ -141,20 +158,26 @@ def send_to_openai(title, game, username, message):
         )
     }
 
-    api_messages = [system_message, prompt] + user_context + [
+    room_messages = []
+    if room_context:
+        room_messages.append({"role": "user", "content": f"Recent messages in {streamer}'s chat, oldest first:\n{room_context}"})
+
+    api_messages = [system_message] + room_messages + [prompt] + user_context + [
         {"role": "user", "content": f"Respond to the following message sent by {username}: {message}."}
     ]
-    logger.info(f"Sending the following request to OpenAI: {api_messages}")
+    logger.info("Sending the following request to OpenAI: %s", payload(api_messages))
     
-    response = client.chat.completions.create(
-        model=config['gpt']['model'],
+    started = time.perf_counter()
+    response = get_openai_client().chat.completions.create(
+        model=profile['model'],
         messages=api_messages,
-        max_tokens=config['gpt']['max_tokens']
+        max_tokens=profile['max_tokens']
     )
+    load_controller.record_latency(time.perf_counter() - started)
     formatted_response = format_openai_response(response)
 
     # Save the current message and the AI response
-    save_message(username, "user", message)  # Save the user's message
-    save_message(username, "ai", formatted_response, ai_name=AI_name)  # Save the AI's response
+    save_message(username, "user", message, history_dir=channel.history_dir)  # Save the user's message
+    save_message(username, "ai", formatted_response, ai_name=AI_name, history_dir=channel.history_dir)  # Save the AI's response
 
     return formatted_response
\ No newline at end of file
@@ -0,0 +1,67 @@
+import os
+from pathlib import Path
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', "hide")
+
+# Length of one envelope frame. The overlay looks up one byte per frame.
+FRAME_MS = 40
+ENVELOPE_SUFFIX = ".env"
+# Rate clips are decoded at when this module starts the mixer itself
+DECODE_FREQUENCY = 44100
+
+def decode_without_playback():
+    """
+    For processes that decode clips but never play them (the generation stage
+    in multi-process mode): the mixer compute_envelope() starts uses SDL's
+    dummy driver, so the audio device stays with the audio stage.
+    Call before anything initializes pygame's mixer.
+    """
+    os.environ['SDL_AUDIODRIVER'] = "dummy"
+
+def envelope_path(audio_path) -> Path:
+    """Sidecar file that holds the envelope for an audio clip."""
+    return Path(audio_path).with_suffix(ENVELOPE_SUFFIX)
+
+def compute_envelope(audio_path, frame_ms: int = FRAME_MS) -> bytes:
+    """
+    Decode an audio clip and return its loudness envelope: one byte (0-255)
+    of RMS level per 'frame_ms' window, normalized to the clip's loud parts.
+    """
+    # Imported here so loading the TTS module doesn't pull in numpy/pygame
+    import numpy as np
+    from pygame import mixer, sndarray
+
+    if not mixer.get_init():
+        mixer.init(frequency=DECODE_FREQUENCY)
+    frequency = mixer.get_init()[0]
+
+    samples = sndarray.array(mixer.Sound(str(audio_path))).astype(np.float32)
+    if samples.ndim > 1:
+        samples = samples.mean(axis=1)
+
+    frame_len = max(1, frequency * frame_ms // 1000)
+    n_frames = -(-len(samples) // frame_len)  # ceil, the last frame is zero-padded
+    if n_frames == 0:
+        return b""
+
+    frames = np.zeros(n_frames * frame_len, dtype=np.float32)
+    frames[:len(samples)] = samples
+    rms = np.sqrt(np.mean(np.square(frames.reshape(n_frames, frame_len)), axis=1))
+
+    # Normalize against the 95th percentile so a single peak doesn't squash the rest
+    reference = np.percentile(rms, 95)
+    if reference <= 0:
+        return bytes(n_frames)
+    return np.clip(rms * (255.0 / reference), 0, 255).astype(np.uint8).tobytes()
+
+def write_envelope(audio_path, frame_ms: int = FRAME_MS):
+    """
+    Compute the envelope for 'audio_path' and store it next to the clip.
+    Returns the envelope bytes, or None if the clip couldn't be decoded.
+    """
+    try:
+        envelope = compute_envelope(audio_path, frame_ms)
+    except Exception as e:
+        print(f"Lip-sync envelope error for {audio_path}: {e}")
+        return None
+    envelope_path(audio_path).write_bytes(envelope)
+    return envelope
@@ -0,0 +1,127 @@
+"""
+Load-adaptive generation settings.
+
+config['gpt']['load_tiers'] lists generation profiles from full quality to
+cheapest. Every tier after the first has a "when" block; the tier applies
+once any of its thresholds is reached:
+
+    backlog     mentions waiting for a GPT worker
+    latency_ms  average of the recent OpenAI response times (calls from the
+                last latency_max_age_s seconds, at most latency_window of them)
+    tts_queue   replies waiting for a TTS worker
+
+Moving to a busier tier happens immediately. Moving back waits until every
+metric has stayed below exit_ratio of the current tier's thresholds for
+cooldown_s, then steps down one tier at a time, so the bot doesn't flap
+between profiles during a raid.
+"""
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from settings import settings
+
+config = settings.config
+
+logger = logging.getLogger("my_app.load")
+
+METRICS = ("backlog", "latency_ms", "tts_queue")
+
+class LoadController:
+    def __init__(self, tiers, defaults, latency_window=10, exit_ratio=0.6, cooldown_s=30,
+                 latency_max_age_s=60):
+        """
+        Args:
+            tiers (list): Tier dicts (name, model, max_tokens, history_messages, room_tokens, when).
+            defaults (dict): model/max_tokens used by tiers that don't set them.
+            latency_window (int): How many recent OpenAI calls the latency average covers.
+            latency_max_age_s (float): Calls older than this no longer count, so a past
+                spike doesn't keep the bot in a busy tier while no mentions come in.
+            exit_ratio (float): Fraction of the current tier's thresholds metrics must drop below.
+            cooldown_s (float): How long they must stay there before stepping back down.
+        """
+        self.tiers = [dict(defaults, **tier) for tier in tiers] or [dict(defaults, name="default")]
+        self.exit_ratio = exit_ratio
+        self.cooldown_s = cooldown_s
+        self.latencies = deque(maxlen=latency_window)  # (monotonic time, ms)
+        self.latency_max_age_s = latency_max_age_s
+        self.probes = {}
+        self.level = 0
+        self._calm_since = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        gpt_config = config['gpt']
+        load_config = gpt_config.get('load', {})
+        defaults = {"model": gpt_config['model'], "max_tokens": gpt_config['max_tokens'],
+                    "history_messages": None, "room_tokens": None}
+        return cls(gpt_config.get('load_tiers', []), defaults,
+                   latency_window=load_config.get('latency_window', 10),
+                   exit_ratio=load_config.get('exit_ratio', 0.6),
+                   cooldown_s=load_config.get('cooldown_s', 30),
+                   latency_max_age_s=load_config.get('latency_max_age_s', 60))
+
+    def watch(self, **probes):
+        """Register callables for the queue metrics, e.g. watch(backlog=queue.qsize)."""
+        self.probes.update(probes)
+
+    def record_latency(self, seconds):
+        with self._lock:
+            self.latencies.append((time.monotonic(), seconds * 1000))
+
+    def metrics(self):
+        values = {name: probe() for name, probe in self.probes.items()}
+        cutoff = time.monotonic() - self.latency_max_age_s
+        with self._lock:
+            while self.latencies and self.latencies[0][0] < cutoff:
+                self.latencies.popleft()
+            if self.latencies:
+                values["latency_ms"] = sum(ms for _, ms in self.latencies) / len(self.latencies)
+        return values
+
+    def _reached(self, tier, values, ratio=1.0):
+        when = tier.get('when', {})
+        return any(name in values and values[name] >= when[name] * ratio for name in METRICS if name in when)
+
+    def profile(self):
+        """The generation settings to use right now: a tier dict (model, max_tokens, history_messages, room_tokens)."""
+        values = self.metrics()
+        now = time.monotonic()
+        with self._lock:
+            previous = self.level
+            target = max((index for index, tier in enumerate(self.tiers) if index and self._reached(tier, values)),
+                         default=0)
+
+            if target > self.level:
+                self.level = target
+                self._calm_since = None
+            elif self.level and not self._reached(self.tiers[self.level], values, self.exit_ratio):
+                # Everything is well below this tier's thresholds; step back after the cooldown
+                if self._calm_since is None:
+                    self._calm_since = now
+                elif now - self._calm_since >= self.cooldown_s:
+                    self.level -= 1
+                    self._calm_since = now if self.level else None
+            else:
+                self._calm_since = None
+            level = self.level
+            tier = self.tiers[level]
+
+        if level != previous:
+            shown = ", ".join(f"{name}={values[name]:.0f}" for name in METRICS if name in values)
+            print(f"[LOAD] {self.tiers[previous]['name']} -> {tier['name']} ({shown})")
+            logger.info("[LOAD] %s -> %s (%s), model=%s max_tokens=%s history=%s",
+                        self.tiers[previous]['name'], tier['name'], shown,
+                        tier['model'], tier['max_tokens'], tier['history_messages'],
+                        extra={"metrics": values, "tier": tier['name']})
+        return tier
+
+    async def monitor(self, interval=5):
+        """Re-evaluate periodically, so the bot also relaxes while no mentions come in."""
+        while True:
+            await asyncio.sleep(interval)
+            self.profile()
+
+load_controller = LoadController.from_config(config)
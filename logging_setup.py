@@ -0,0 +1,146 @@
+"""
+Logging pipeline.
+
+Log calls only put the record on a queue; a QueueListener thread formats it
+(JSON lines by default) and writes it to a rotating log file, so the event
+loop never waits on disk or on formatting big payloads. Large values (chat
+history, request bodies) should be logged through payload(), which defers
+serialization to the listener thread and truncates the result. Only a sample
+of records get their payloads written at all (logging.payload_sample_rate).
+
+In multi-process mode the stage processes send their records to the
+supervisor's listener over a multiprocessing queue, so one process owns
+the log file and its rotation.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+from datetime import datetime
+
+# Standard LogRecord attributes; anything else on a record came in through extra=
+_RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+class Payload:
+    """A large value to log; serialized (and truncated) only when the record is written."""
+
+    max_chars = 2000
+
+    def __init__(self, value):
+        self.value = value
+        self.omitted = False
+
+    def __str__(self):
+        if self.omitted:
+            size = f", {len(self.value)} items" if hasattr(self.value, "__len__") else ""
+            return f"<{type(self.value).__name__}{size} not sampled>"
+        text = json.dumps(self.value, ensure_ascii=False, default=str)
+        if len(text) > self.max_chars:
+            text = f"{text[:self.max_chars]}... (+{len(text) - self.max_chars} chars)"
+        return text
+
+def payload(value):
+    return Payload(value)
+
+class PayloadSampler(logging.Filter):
+    """Keep payloads on a 'rate' fraction of records; the rest log a short summary."""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if self.rate < 1 and isinstance(record.args, tuple) and random.random() >= self.rate:
+            for arg in record.args:
+                if isinstance(arg, Payload):
+                    arg.omitted = True
+        return True
+
+class ChatFilter(logging.Filter):
+    def filter(self, record):
+        return "HTTP Request" not in record.getMessage()
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message and any extra= fields."""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "process": record.processName,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_FIELDS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler for a same-process listener: the record is queued as-is and
+    its message is built on the listener thread. Don't mutate objects after
+    passing them as log arguments.
+    """
+
+    def prepare(self, record):
+        return record
+
+def _file_handler(log_config):
+    path = log_config.get('file', 'log.log')
+    backup_count = log_config.get('backup_count', 5)
+    if log_config.get('rotate', 'size') == 'time':
+        handler = logging.handlers.TimedRotatingFileHandler(
+            path, when=log_config.get('when', 'midnight'), backupCount=backup_count, encoding='utf-8')
+    else:
+        handler = logging.handlers.RotatingFileHandler(
+            path, maxBytes=log_config.get('max_bytes', 10 * 2**20), backupCount=backup_count, encoding='utf-8')
+
+    if log_config.get('format', 'json') == 'json':
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter('%(asctime)s: %(message)s', datefmt='%Y-%m-%d %H:%M:%S'))
+    handler.addFilter(ChatFilter())
+    return handler
+
+def _install_queue_handler(handler, log_config):
+    Payload.max_chars = log_config.get('payload_max_chars', 2000)
+    handler.addFilter(PayloadSampler(log_config.get('payload_sample_rate', 1.0)))
+
+    root = logging.getLogger()
+    root.setLevel(log_config.get('level', 'INFO'))
+    root.addHandler(handler)
+
+    # Disable ALL OpenAI logging
+    logging.getLogger("openai").setLevel(logging.ERROR)
+    # Disable httpx logging
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+def setup_logging(config, log_queue=None):
+    """
+    Send the root logger's records through a queue to a background listener
+    that writes the log file. Pass a multiprocessing queue as log_queue to
+    also collect records from child processes (see attach_to_log_queue).
+    Returns the started QueueListener.
+    """
+    log_config = config.get('logging', {})
+    if log_queue is None:
+        log_queue = queue.SimpleQueue()
+        handler = LazyQueueHandler(log_queue)
+    else:
+        handler = logging.handlers.QueueHandler(log_queue)
+    _install_queue_handler(handler, log_config)
+
+    listener = logging.handlers.QueueListener(log_queue, _file_handler(log_config), respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+def attach_to_log_queue(config, log_queue):
+    """In a child process: forward all records to the parent's listener."""
+    # Records have to be pickled, so their messages are built before queuing
+    _install_queue_handler(logging.handlers.QueueHandler(log_queue), config.get('logging', {}))
@@ -4,65 +4,82 @@ from gpt import send_to_openai
 from pathlib import Path
 import os
 os.environ['PYGAME_HIDE_SUPPORT_PROMPT'] = "hide"
-from pygame import mixer
-from queue import Queue
-import json
+from queue import Queue, Empty
 import sys
 import logging
 from ui import start_voice_ui
 import threading
+import multiprocessing
+import signal
 from response_formatter import extract_emotion
+from lipsync import FRAME_MS, decode_without_playback
+import time
 
 # Import from avatar
 from avatar import run_avatar_server, set_avatar_state
+from clients import keep_connections_warm, close_clients
+from channels import CHANNELS, FairQueue, MAX_PENDING_MENTIONS, get_channel
+from settings import settings
+from load_control import load_controller
+from diagnostics import register_queue, queue_sizes
+from logging_setup import setup_logging, attach_to_log_queue
 
-# Load config
-with open('config.json') as f:
-    config = json.load(f)
+config = settings.config
 
-# Create custom filter
-class ChatFilter(logging.Filter):
-    def filter(self, record):
-        return "HTTP Request" not in record.getMessage()
-
-# Configure logging with UTF-8 encoding
+# Root logger; handlers are installed by setup_logging() when the bot starts
 logger = logging.getLogger()
-logger.setLevel(logging.INFO)
 
-# Create file handler with simplified format
-file_handler = logging.FileHandler('log.log', encoding='utf-8')
-file_handler.setFormatter(
-    logging.Formatter('%(asctime)s: %(message)s', 
-                     datefmt='%Y-%m-%d %H:%M:%S')
-)
-file_handler.addFilter(ChatFilter())
-logger.addHandler(file_handler)
+Path(settings.output_dir).mkdir(exist_ok=True)
 
-# Disable ALL OpenAI logging
-logging.getLogger("openai").setLevel(logging.ERROR)
-logging.getLogger("openai.api_requestor").setLevel(logging.ERROR)
-logging.getLogger("openai.http_client").setLevel(logging.ERROR)
+# pygame's mixer, imported when the audio task starts so it doesn't slow startup
+mixer = None
 
-# Disable httpx logging
-logging.getLogger("httpx").setLevel(logging.WARNING)
+# Finished clips from the TTS workers: (path, emotion, envelope, channel_name)
+audio_queue = Queue()
 
-Path(config['paths']['output_dir']).mkdir(exist_ok=True)
-mixer.init()
+# Messages that mention the AI, one lane per channel so the LLM workers take turns
+mention_queue = FairQueue(max_per_key=MAX_PENDING_MENTIONS)
 
-audio_queue = Queue()
-channel_name = config['twitch']['channel_name']
+# Size of the shared LLM worker pool. Each channel has one mention in flight at a time
+# (so its replies stay in order), so more workers than channels would only idle
+GPT_WORKERS = min(config['gpt'].get('workers', 2), len(CHANNELS))
 
-current_game = None
-current_title = None
+# An overlay starts its clip on its next poll, so give it a little extra time
+OVERLAY_START_MARGIN = 0.5
 
-# This is our new AI name from config
-AI_NAME = config['gpt'].get('ai_name', 'assistant')
+MULTI_CHANNEL = len(CHANNELS) > 1
 
-voice_mode = config['voice']['mode']
+from voice_queue import add_to_voice_queue, voice_buffer
+
+# Only the selected TTS provider's module (and SDK) is loaded
+voice_mode = settings.voice_mode
 if voice_mode == 'openai':
-    from voice_openai import process_voice_queue, add_to_voice_queue
+    from voice_openai import process_voice_queue
 elif voice_mode == 'elevenlabs':
-    from voice import process_voice_queue, add_to_voice_queue
+    from voice import process_voice_queue
+
+# Generation gets cheaper while mentions or replies pile up
+load_controller.watch(backlog=mention_queue.qsize, tts_queue=voice_buffer.qsize)
+
+# Queue sizes shown under /admin/queues on the avatar server. Each process registers only
+# the queues it works on; in multi-process mode the other copies would always read 0
+def register_generation_queues():
+    register_queue("mentions", mention_queue.qsize)
+    register_queue("tts", voice_buffer.qsize)
+
+def register_playback_queues(clips_in=audio_queue):
+    register_queue("clips_ready", clips_in.qsize)
+    register_queue("clips_waiting", lambda: {channel.name: len(channel.clips) for channel in CHANNELS.values()})
+
+def log_tag(channel):
+    """Channel prefix for console/log lines, only needed with several channels."""
+    return f"[{channel.name}]" if MULTI_CHANNEL else ""
+
+def init_audio():
+    global mixer
+    from pygame import mixer as pygame_mixer
+    pygame_mixer.init()
+    mixer = pygame_mixer
 
 def play_audio_file(audio_file):
     if not mixer.music.get_busy():
@@ -74,114 +91,394 @@ def play_audio_file(audio_file):
             print(f"Audio playback error: {e}")
     return False
 
-async def process_audio_queue():
+def clip_duration(audio_file, envelope):
+    if envelope:
+        return len(envelope) * FRAME_MS / 1000
+    return mixer.Sound(audio_file).get_length()
+
+def start_overlay_clips(now):
+    """Hand the next clip to each overlay-playback channel whose last clip has ended."""
+    for channel in CHANNELS.values():
+        if channel.playback == "local" or now < channel.clip_ends_at:
+            continue
+        if channel.clips:
+            audio_file, emotion, envelope = channel.clips.popleft()
+            channel.clip_ends_at = now + clip_duration(audio_file, envelope) + OVERLAY_START_MARGIN
+            set_avatar_state(emotion=emotion, talking=True,
+                             envelope=envelope, frame_ms=FRAME_MS, started_at=now,
+                             channel=channel.name, audio_file=audio_file)
+        elif channel.clip_ends_at:
+            channel.clip_ends_at = 0.0
+            set_avatar_state(talking=False, channel=channel.name)
+
+async def process_audio_queue(clips_in=audio_queue):
+    init_audio()
+    local_channels = [c for c in CHANNELS.values() if c.playback == "local"]
+    speaking = None  # channel whose clip is on the local speakers
+    turn = 0
     while True:
-        # If mixer isn't busy AND we have a file, play it
-        if not mixer.music.get_busy() and not audio_queue.empty():
-            audio_file, emotion = audio_queue.get()
-            if emotion:
-                set_avatar_state(emotion=emotion, talking=True)
-            else:
-                set_avatar_state(talking=True)
-
-            play_audio_file(audio_file)
+        # Route finished clips to their channel
+        while True:
+            try:
+                audio_file, emotion, envelope, channel_name = clips_in.get_nowait()
+            except Empty:
+                break
+            get_channel(channel_name).clips.append((audio_file, emotion, envelope))
+
+        start_overlay_clips(time.time())
+
+        # If mixer isn't busy AND a local channel has a clip, play it (channels take turns)
+        if not mixer.music.get_busy():
+            ready = [c for c in local_channels if c.clips]
+            if ready:
+                channel = ready[turn % len(ready)]
+                turn += 1
+                audio_file, emotion, envelope = channel.clips.popleft()
+                if play_audio_file(audio_file):
+                    if speaking is not None and speaking is not channel:
+                        set_avatar_state(talking=False, channel=speaking.name)
+                    speaking = channel
+                    # Hand the overlay the clip's envelope and the moment playback began
+                    set_avatar_state(emotion=emotion, talking=True,
+                                     envelope=envelope, frame_ms=FRAME_MS,
+                                     started_at=time.time(), channel=channel.name)
+            elif speaking is not None:
+                # Playback ended AND nothing queued: set talking=False
+                set_avatar_state(talking=False, channel=speaking.name)
+                speaking = None
 
         await asyncio.sleep(0.1)
 
-        # If playback ended AND queue empty, set talking=False
-        if not mixer.music.get_busy() and audio_queue.empty():
-            set_avatar_state(talking=False)
-
 def process_voice_input(text):
-    global current_title, current_game
-    # Create special voice message that gets priority
-    response = send_to_openai(current_title, current_game, channel_name, text)
+    # Voice input always talks to the first (local) channel
+    channel = get_channel()
+    response = send_to_openai(channel.title, channel.game, channel.name, text, channel)
     return response  # Return response instead of directly adding to queue
 
+def handle_chat_item(channel_name, username, payload):
+    """Record channel info or a chat line; queue chat messages that mention the AI."""
+    channel = get_channel(channel_name)
+
+    # Check if it's channel info or normal chat
+    if username == "__channel_info__":
+        title, game_name = payload
+        channel.title = title
+        channel.game = game_name
+        print(f"[CHANNEL INFO]{log_tag(channel)} Title='{title}', Game='{game_name}'")
+        logger.info("[CHANNEL INFO]%s Title='%s', Game='%s'", log_tag(channel), title, game_name,
+                    extra={"channel": channel.name})
+
+    # A normal chat message: it becomes room context either way
+    elif payload:
+        room_seq = channel.room.add(username, payload)
+        # Does it mention the AI name? (case-insensitive)
+        if channel.mentions_ai(payload):
+            # Past MAX_PENDING_MENTIONS the channel's oldest mention is dropped
+            mention_queue.put(channel.name, {"username": username, "msg": payload, "room_seq": room_seq})
+
+async def respond_to_mentions():
+    """One worker of the shared LLM pool; channels are served round-robin, one mention at a time each."""
+    while True:
+        try:
+            channel_name, mention = mention_queue.get_nowait()
+        except Empty:
+            await asyncio.sleep(0.05)
+            continue
+
+        try:
+            channel = get_channel(channel_name)
+            user = mention["username"]
+            text = mention["msg"]
+
+            print(f"[MENTION]{log_tag(channel)} {user}: {text}")
+            logger.info("[MENTION]%s %s: %s", log_tag(channel), user, text,
+                        extra={"channel": channel.name, "user": user})
+
+            # Send to GPT (blocking SDK call, so run it off the loop)
+            gpt_response = await asyncio.to_thread(
+                send_to_openai,
+                channel.title,
+                channel.game,
+                user,
+                text,
+                channel,
+                # Room context up to (not including) this message, which the prompt quotes anyway
+                mention.get("room_seq")
+            )
+
+            # Check for emotion prefix ([happy], [sad], [angry])
+            emotion, gpt_response = extract_emotion(gpt_response)
+
+            print(f"[GPT RESPONSE]{log_tag(channel)}[{emotion}]: {gpt_response}")
+            logger.info("[GPT RESPONSE]%s[%s]: %s", log_tag(channel), emotion, gpt_response,
+                        extra={"channel": channel.name, "user": user})
+
+            # Send result to TTS queue
+            add_to_voice_queue(gpt_response, emotion=emotion, channel=channel)
+        except Exception as e:
+            print(f"Error responding to mention: {e}", file=sys.stderr)
+        finally:
+            # The channel's next mention can go out now; this reply is already in the TTS lane
+            mention_queue.task_done(channel_name)
+
+def start_avatar_server():
+    # One server, an overlay per channel
+    avatar_config = config.get('avatar', {})
+    return asyncio.create_task(run_avatar_server(avatar_config.get('host', '127.0.0.1'),
+                                                 avatar_config.get('port', 5000)))
+
+def start_voice_ui_thread():
+    voice_ui_thread = threading.Thread(
+        target=start_voice_ui,
+        args=(process_voice_input,),
+        daemon=True
+    )
+    voice_ui_thread.start()
+    return voice_ui_thread
+
+def warm_providers(twitch=True):
+    # Open provider connections now so the first mention doesn't pay for the handshakes
+    providers = ["openai"] + (["twitch", "twitch_id"] if twitch else [])
+    if voice_mode == 'elevenlabs':
+        providers.append("elevenlabs")
+    return providers
+
 async def main():
-    # This queue receives all Twitch chat messages plus ("__channel_info__", ...) events
+    # This queue receives all Twitch chat messages plus (channel, "__channel_info__", ...) events
     chat_message_queue = asyncio.Queue()
-    
-    # We'll store the last known channel title/game
-    global current_title, current_game
+    register_queue("chat", chat_message_queue.qsize)
+    register_generation_queues()
+    register_playback_queues()
 
-    # Start the avatar server
-    asyncio.create_task(run_avatar_server())
+    avatar_task = start_avatar_server()
+    warm_task = asyncio.create_task(keep_connections_warm(warm_providers()))
 
-    # Launch Twitch reading & TTS tasks
-    twitch_task = asyncio.create_task(read_chat_forever(channel_name, chat_message_queue, config))
+    # Launch Twitch reading, the shared LLM/TTS pools and playback
+    twitch_task = asyncio.create_task(read_chat_forever(list(CHANNELS), chat_message_queue, config))
+    gpt_tasks   = [asyncio.create_task(respond_to_mentions()) for _ in range(GPT_WORKERS)]
     voice_task  = asyncio.create_task(process_voice_queue(audio_queue))
+    load_task   = asyncio.create_task(load_controller.monitor())
     audio_task  = asyncio.create_task(process_audio_queue())
-    
-    # This is our queue for messages that specifically mention the AI
-    mention_queue = []
 
     # Start the voice UI thread
-    voice_ui_thread = threading.Thread(
-        target=start_voice_ui,
-        args=(process_voice_input,),
-        daemon=True
-    )
-    voice_ui_thread.start()
+    start_voice_ui_thread()
 
     while True:
         try:
-            # 1) Wait for the next incoming item from Twitch
-            username, msg_or_tuple = await chat_message_queue.get()
-
-            # 2) Check if it's channel info or normal chat
-            if username == "__channel_info__":
-                title, game_name = msg_or_tuple
-                current_title = title
-                current_game = game_name
-                print(f"[CHANNEL INFO] Title='{title}', Game='{game_name}'")
-                logger.info(f"[CHANNEL INFO] Title='{title}', Game='{game_name}'")
-            
-            else:
-                # A normal chat message
-                msg = msg_or_tuple
-                if msg:
-                    # 3) Does this message mention the AI name?
-                    #    We'll do a case-insensitive check
-                    if AI_NAME.lower() in msg.lower():
-                        # Add to mention_queue
-                        mention_queue.append({"username": username, "msg": msg})
-                        # If we exceed 5, pop the oldest
-                        if len(mention_queue) > 5:
-                            mention_queue.pop(0)
-            
-            # 4) If mention_queue has messages, respond to them (FIFO: pop(0))
-            if mention_queue:
-                mention = mention_queue.pop(0)
-                user = mention["username"]
-                text = mention["msg"]
-
-                print(f"[MENTION] {user}: {text}")
-                logger.info(f"[MENTION] {user}: {text}")
-
-                # 5) Send to GPT
-                gpt_response = send_to_openai(
-                    current_title,
-                    current_game,
-                    user,
-                    text
-                )
-
-                # 6) Check for emotion prefix ([happy], [sad], [angry])
-                emotion, gpt_response = extract_emotion(gpt_response)
-
-                print(f"[GPT RESPONSE][{emotion}]: {gpt_response}")
-                logger.info(f"[GPT RESPONSE][{emotion}]: {gpt_response}")
-
-                # 7) Send result to TTS queue
-                add_to_voice_queue(gpt_response, emotion=emotion)
-
-            # Let the loop breathe
-            await asyncio.sleep(0.01)
+            # Wait for the next incoming item from Twitch
+            channel_name, username, payload = await chat_message_queue.get()
+            handle_chat_item(channel_name, username, payload)
 
         except Exception as e:
             print(f"Error in main loop: {e}", file=sys.stderr)
             await asyncio.sleep(1)
 
+### Warm restarts: pending work and channel info survive a restart (see snapshot.py)
+
+snapshot_config = config.get('snapshot', {})
+
+def _max_age(part):
+    return snapshot_config.get('max_age_s', {}).get(part, 300)
+
+def snapshot_clips():
+    """Unplayed clips as (channel, (path, emotion, envelope)), oldest first per channel."""
+    pending = [(channel.name, clip) for channel in CHANNELS.values() for clip in channel.clips]
+    with audio_queue.mutex:
+        pending += [(channel_name, (path, emotion, envelope))
+                    for path, emotion, envelope, channel_name in audio_queue.queue]
+    return pending
+
+def restore_clips(pending):
+    # A clip's age is its file's age; clips deleted by cleanup in the meantime are skipped
+    cutoff = time.time() - _max_age('clips')
+    restored = 0
+    for channel_name, clip in pending:
+        try:
+            fresh = os.path.getmtime(clip[0]) >= cutoff
+        except OSError:
+            continue
+        if fresh and channel_name in CHANNELS:
+            CHANNELS[channel_name].clips.append(clip)
+            restored += 1
+    return restored
+
+def snapshot_channel_info():
+    return {channel.name: (channel.title, channel.game) for channel in CHANNELS.values()}
+
+def restore_channel_info(info):
+    restored = 0
+    for channel_name, (title, game) in info.items():
+        channel = CHANNELS.get(channel_name)
+        if channel is not None and channel.title is None and title is not None:
+            channel.title, channel.game = title, game
+            restored += 1
+    return restored
+
+def _configured_channels(entries):
+    """Drop snapshot entries for channels that were renamed or removed from config since."""
+    return {channel_name: items for channel_name, items in entries.items() if channel_name in CHANNELS}
+
+def restore_mentions(entries):
+    for items in entries.values():
+        for _, mention in items:
+            # Room context line numbers belong to the previous run
+            mention.pop("room_seq", None)
+    return mention_queue.restore(_configured_channels(entries), _max_age('mentions'))
+
+SNAPSHOT_PARTS = {
+    "mentions": (mention_queue.snapshot, restore_mentions),
+    "tts": (voice_buffer.snapshot,
+            lambda data: voice_buffer.restore(_configured_channels(data), _max_age('tts'))),
+    "clips": (snapshot_clips, restore_clips),
+    "channels": (snapshot_channel_info, restore_channel_info),
+}
+
+def create_snapshotter(parts, suffix=""):
+    """A Snapshotter for the named SNAPSHOT_PARTS, or None when snapshots are disabled."""
+    from snapshot import Snapshotter
+
+    if not snapshot_config.get('enabled', True):
+        return None
+    path = snapshot_config.get('path', os.path.join(config['paths'].get('cache_dir', 'cache'), 'state.pickle'))
+    if suffix:
+        root, ext = os.path.splitext(path)
+        path = f"{root}-{suffix}{ext}"
+    snapshotter = Snapshotter(path, snapshot_config.get('interval_s', 30))
+    for name in parts:
+        snapshotter.register(name, *SNAPSHOT_PARTS[name])
+    return snapshotter
+
+async def run_with_snapshots(coro, snapshotter):
+    if snapshotter is not None:
+        snapshot_task = asyncio.create_task(snapshotter.run())
+    try:
+        await coro
+    finally:
+        # Also runs when Ctrl+C/SIGTERM cancels the loop's tasks
+        await close_clients()
+
+def run_until_stopped(coro, snapshotter):
+    """Run 'coro' until Ctrl+C or SIGTERM, then close the pooled connections and write a final snapshot."""
+    # SIGTERM (e.g. the supervisor stopping a stage) unwinds like Ctrl+C, so the snapshot gets saved
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    if snapshotter is not None:
+        snapshotter.restore()
+    try:
+        asyncio.run(run_with_snapshots(coro, snapshotter))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # A second Ctrl+C/SIGTERM (or the supervisor's stop request arriving too) must not cut the save short
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        if snapshotter is not None:
+            snapshotter.save()
+
+### Multi-process mode (config['process']['mode'] == "multi")
+#
+#   ingest      Twitch IRC + channel info       --chat_queue-->   generation
+#   generation  mentions, GPT/TTS pools, voice UI --audio_queue-->  audio
+#   audio       pygame playback + avatar overlay server
+#
+# Clips are already files on disk, so only their paths and lip-sync envelopes
+# cross process boundaries and plain multiprocessing queues are enough.
+
+process_config = config.get('process', {})
+STATS_INTERVAL = process_config.get('stats_interval', 60)
+
+async def mp_get(mp_queue, timeout=1.0):
+    """Await the next item of a multiprocessing queue without blocking the loop."""
+    while True:
+        try:
+            return await asyncio.to_thread(mp_queue.get, True, timeout)
+        except Empty:
+            continue
+
+# Which state each stage persists; every stage writes its own snapshot file
+STAGE_SNAPSHOTS = {"generation": ("mentions", "tts", "channels"), "audio": ("clips",)}
+
+def run_stage(stage, coro_fn, stats_queue, log_queue, stop_event, *args):
+    """Entry point of a stage process."""
+    from supervisor import start_stats_reporter, start_stop_watcher
+    attach_to_log_queue(config, log_queue)
+    start_stats_reporter(stage, stats_queue, STATS_INTERVAL, queue_sizes)
+    start_stop_watcher(stop_event)
+    snapshotter = create_snapshotter(STAGE_SNAPSHOTS[stage], suffix=stage) if stage in STAGE_SNAPSHOTS else None
+    run_until_stopped(coro_fn(*args), snapshotter)
+
+async def ingest_stage(chat_out, info_requests):
+    chat_message_queue = asyncio.Queue()
+    register_queue("chat", chat_message_queue.qsize)
+    warm_task = asyncio.create_task(keep_connections_warm(["twitch", "twitch_id"]))
+    twitch_task = asyncio.create_task(read_chat_forever(list(CHANNELS), chat_message_queue, config))
+
+    # A restarted generation stage asks for the current title/game again
+    latest_info = {}
+    async def replay_channel_info():
+        while True:
+            await mp_get(info_requests)
+            for item in latest_info.values():
+                chat_out.put(item)
+    replay_task = asyncio.create_task(replay_channel_info())
+
+    while True:
+        item = await chat_message_queue.get()
+        if item[1] == "__channel_info__":
+            latest_info[item[0]] = item
+        chat_out.put(item)
+
+async def generation_stage(chat_in, audio_out, info_requests):
+    # Lip-sync envelopes are decoded here, but only the audio stage opens the audio device
+    decode_without_playback()
+    register_generation_queues()
+    warm_task  = asyncio.create_task(keep_connections_warm(warm_providers(twitch=False)))
+    gpt_tasks  = [asyncio.create_task(respond_to_mentions()) for _ in range(GPT_WORKERS)]
+    voice_task = asyncio.create_task(process_voice_queue(audio_out))
+    load_task  = asyncio.create_task(load_controller.monitor())
+    start_voice_ui_thread()
+
+    info_requests.put(True)
+    while True:
+        try:
+            channel_name, username, payload = await mp_get(chat_in)
+            handle_chat_item(channel_name, username, payload)
+        except Exception as e:
+            print(f"Error in generation stage: {e}", file=sys.stderr)
+
+async def audio_stage(audio_in):
+    # /admin/ describes this process; the other stages' queue sizes are in their [PROCESS STATS] log lines
+    register_playback_queues(audio_in)
+    avatar_task = start_avatar_server()
+    await process_audio_queue(audio_in)
+
+def run_multiprocess(ctx, log_queue):
+    from supervisor import Supervisor
+
+    chat_queue, audio_out, info_requests, stats_queue = (ctx.Queue() for _ in range(4))
+
+    supervisor = Supervisor(stats_queue,
+                            backoff_base=process_config.get('restart_backoff_base', 1),
+                            backoff_max=process_config.get('restart_backoff_max', 30),
+                            stable_after=process_config.get('stable_after', 60),
+                            stop_grace=process_config.get('stop_grace', 10),
+                            context=ctx)
+    stage_args = (stats_queue, log_queue, supervisor.stop_event)
+    supervisor.add_stage("ingest", run_stage, "ingest", ingest_stage, *stage_args,
+                         chat_queue, info_requests)
+    supervisor.add_stage("generation", run_stage, "generation", generation_stage, *stage_args,
+                         chat_queue, audio_out, info_requests)
+    supervisor.add_stage("audio", run_stage, "audio", audio_stage, *stage_args, audio_out)
+    supervisor.run(stats_interval=STATS_INTERVAL)
+
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    # Needed for the frozen Windows build, whose stage processes re-run the executable
+    multiprocessing.freeze_support()
+    if process_config.get('mode', 'single') == 'multi':
+        # One listener in this process writes the log for every stage
+        ctx = multiprocessing.get_context("spawn")
+        log_queue = ctx.Queue()
+        setup_logging(config, log_queue)
+        run_multiprocess(ctx, log_queue)
+    else:
+        setup_logging(config)
+        run_until_stopped(main(), create_snapshotter(SNAPSHOT_PARTS))
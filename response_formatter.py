@@ -9,6 +9,10 @@ def format_chat_message(line):
     message = parts[1].split('PRIVMSG', 1)[1].split(':', 1)[1]
     return username, message
 
+def chat_channel(line):
+    """Channel name (without '#') a PRIVMSG line was sent to"""
+    return line.split('PRIVMSG #', 1)[1].split(' ', 1)[0].lower()
+
 def extract_emotion(text):
     """Extract emotion prefix and return (emotion, cleaned_text)"""
     emotion = None
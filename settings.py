@@ -0,0 +1,60 @@
+"""
+Config and secrets, loaded once per process.
+
+Every module reads settings through the shared 'settings' object instead of
+parsing config.json / SECRETS.json itself:
+
+    from settings import settings
+    config = settings.config
+"""
+import json
+import os
+from functools import cached_property
+
+CONFIG_FILE = 'config.json'
+SECRETS_FILE = 'SECRETS.json'
+
+class Settings:
+    def __init__(self, config_file: str = CONFIG_FILE, secrets_file: str = SECRETS_FILE):
+        self.config_file = config_file
+        self.secrets_file = secrets_file
+
+    @cached_property
+    def config(self) -> dict:
+        with open(self.config_file) as f:
+            return json.load(f)
+
+    @cached_property
+    def secrets(self) -> dict:
+        """SECRETS.json, read on first use so commands that don't need it still start."""
+        try:
+            with open(self.secrets_file) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise FileNotFoundError(f"The {self.secrets_file} file was not found.")
+        except json.JSONDecodeError:
+            raise ValueError(f"The {self.secrets_file} file is not a valid JSON.")
+
+    def secret(self, provider: str, key: str = "authToken") -> str:
+        try:
+            return self.secrets[provider][key]
+        except KeyError as e:
+            raise KeyError(f"Key {e} not found in the {self.secrets_file} file.")
+
+    def save_secrets(self):
+        """Write the (possibly updated) secrets back to disk."""
+        tmp_path = self.secrets_file + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.secrets, f, indent=2)
+        os.replace(tmp_path, self.secrets_file)
+
+    # Typed shortcuts for values several modules need (per-channel values live in channels.py)
+    @property
+    def voice_mode(self) -> str:
+        return self.config['voice']['mode']
+
+    @property
+    def output_dir(self) -> str:
+        return self.config['paths']['output_dir']
+
+settings = Settings()
@@ -0,0 +1,88 @@
+"""
+Warm restarts: persist pipeline state and restore it on startup.
+
+A Snapshotter collects named parts (pending mentions, queued TTS texts,
+unplayed clips, channel title/game, ...) into one pickle file, periodically
+and on shutdown, and hands each part back to its loader when the bot
+starts. Items carry the time they were queued, so loaders can drop the ones
+that are too old to still be worth answering.
+
+The file is written atomically (temp file + rename), so a crash mid-write
+leaves the previous snapshot intact. It is only ever read back by this
+program; don't load snapshot files from elsewhere.
+"""
+import asyncio
+import logging
+import os
+import pickle
+import time
+
+logger = logging.getLogger("my_app.snapshot")
+
+SNAPSHOT_VERSION = 1
+
+class Snapshotter:
+    def __init__(self, path, interval=30):
+        self.path = path
+        self.interval = interval
+        # name -> (dump() -> picklable data, load(data))
+        self.parts = {}
+
+    def register(self, name, dump, load):
+        self.parts[name] = (dump, load)
+
+    def collect(self):
+        return {
+            "version": SNAPSHOT_VERSION,
+            "saved_at": time.time(),
+            "parts": {name: dump() for name, (dump, _) in self.parts.items()},
+        }
+
+    def save(self, state=None):
+        """Write the current state (or an already collected one) to disk."""
+        data = pickle.dumps(state or self.collect(), protocol=pickle.HIGHEST_PROTOCOL)
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, self.path)
+        return len(data)
+
+    def restore(self):
+        """Load the last snapshot, if any, and pass each part to its loader."""
+        started = time.perf_counter()
+        try:
+            with open(self.path, 'rb') as f:
+                state = pickle.load(f)
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            print(f"Could not read state snapshot {self.path}: {e}")
+            return False
+        if not isinstance(state, dict) or state.get("version") != SNAPSHOT_VERSION:
+            print(f"Ignoring state snapshot {self.path} from another version")
+            return False
+
+        restored = {}
+        for name, data in state["parts"].items():
+            if name not in self.parts:
+                continue
+            try:
+                restored[name] = self.parts[name][1](data)
+            except Exception as e:
+                print(f"Could not restore {name} from snapshot: {e}")
+
+        age = time.time() - state["saved_at"]
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        print(f"[SNAPSHOT] Restored state from {age:.0f}s ago in {elapsed_ms:.1f} ms: {restored}")
+        logger.info("[SNAPSHOT] Restored %s from %.0fs ago in %.1f ms", restored, age, elapsed_ms)
+        return True
+
+    async def run(self):
+        """Save every 'interval' seconds. The file is written off the event loop."""
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await asyncio.to_thread(self.save, self.collect())
+            except Exception as e:
+                print(f"Error saving state snapshot: {e}")
@@ -0,0 +1,197 @@
+"""
+Process supervisor for the optional multi-process layout.
+
+Each stage runs in its own process (spawned, so it behaves the same on
+Windows and Linux). The supervisor restarts a stage that exits with jittered
+backoff, and every stage reports its own CPU time, RSS and queue sizes on a
+stats queue so the supervisor can log per-process CPU%/memory and backlog.
+Stats come from psutil (in requirements.txt). Should it be missing, Unix
+falls back to the standard `resource` module, which reports peak rather than
+current RSS.
+"""
+import logging
+import multiprocessing
+import os
+import signal
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from queue import Empty
+from clients import backoff_delay
+
+logger = logging.getLogger("my_app.supervisor")
+
+def process_usage():
+    """(cpu_seconds, rss_bytes) of the current process; (None, None) if unavailable."""
+    try:
+        import psutil
+    except ImportError:
+        psutil = None
+    if psutil is not None:
+        process = psutil.Process()
+        cpu = process.cpu_times()
+        return cpu.user + cpu.system, process.memory_info().rss
+
+    try:
+        import resource
+    except ImportError:
+        return None, None
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    rss = usage.ru_maxrss if sys.platform == "darwin" else usage.ru_maxrss * 1024
+    return usage.ru_utime + usage.ru_stime, rss
+
+def start_stats_reporter(stage, stats_queue, interval, queue_sizes=None):
+    """
+    Put (stage, pid, monotonic time, cpu_seconds, rss_bytes, queue sizes) on
+    stats_queue every 'interval' seconds. 'queue_sizes' returns the sizes of
+    the queues this process owns ({} when not given).
+    """
+    def report():
+        while True:
+            cpu_seconds, rss = process_usage()
+            queues = queue_sizes() if queue_sizes is not None else {}
+            stats_queue.put((stage, os.getpid(), time.monotonic(), cpu_seconds, rss, queues))
+            time.sleep(interval)
+
+    thread = threading.Thread(target=report, name=f"{stage}-stats", daemon=True)
+    thread.start()
+    return thread
+
+def start_stop_watcher(stop_event):
+    """
+    Unwind this process like Ctrl+C once the supervisor sets 'stop_event', so
+    its shutdown code (final snapshot, closing connections) runs. Works the
+    same on Windows, where terminate() would kill the process outright.
+    """
+    def watch():
+        stop_event.wait()
+        # SIGINT has to reach the main thread to wake an event loop blocked in
+        # select(); Windows' proactor loop is woken by its signal wakeup fd
+        if hasattr(signal, "pthread_kill"):
+            signal.pthread_kill(threading.main_thread().ident, signal.SIGINT)
+        else:
+            signal.raise_signal(signal.SIGINT)
+
+    thread = threading.Thread(target=watch, name="stop-watcher", daemon=True)
+    thread.start()
+    return thread
+
+@dataclass
+class Stage:
+    name: str
+    target: object
+    args: tuple = ()
+    process: object = None
+    started_at: float = 0.0
+    restarts: int = 0
+    restart_at: float = None
+
+class Supervisor:
+    """Starts the stages, restarts the ones that die and logs their resource usage."""
+
+    def __init__(self, stats_queue, backoff_base=1, backoff_max=30, stable_after=60, stop_grace=10, context=None):
+        """
+        Args:
+            stats_queue: Queue the stages report usage on (see start_stats_reporter).
+            backoff_base (float): First restart delay cap, doubled per crash.
+            backoff_max (float): Longest delay between restarts.
+            stable_after (float): A stage that ran this long has its crash count reset.
+            stop_grace (float): How long stages get to shut down cleanly before they're terminated.
+            context: multiprocessing context; "spawn" by default.
+        """
+        self.stats_queue = stats_queue
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.stable_after = stable_after
+        self.context = context or multiprocessing.get_context("spawn")
+        self.stop_grace = stop_grace
+        # Set to ask every stage to shut down (see start_stop_watcher)
+        self.stop_event = self.context.Event()
+        self.stages = {}
+        # stage name -> (pid, monotonic time, cpu_seconds) of its last report
+        self._last_samples = {}
+        self._stopping = False
+
+    def add_stage(self, name, target, *args):
+        self.stages[name] = Stage(name, target, args)
+
+    def _start(self, stage):
+        stage.process = self.context.Process(target=stage.target, args=stage.args,
+                                             name=stage.name, daemon=True)
+        stage.process.start()
+        stage.started_at = time.monotonic()
+        stage.restart_at = None
+        logger.info("[SUPERVISOR] Started %s (pid %s)", stage.name, stage.process.pid)
+
+    def _check(self, stage, now):
+        if stage.process.is_alive():
+            return
+        if stage.restart_at is None:
+            if now - stage.started_at >= self.stable_after:
+                stage.restarts = 0
+            delay = backoff_delay(stage.restarts, self.backoff_base, self.backoff_max)
+            stage.restarts += 1
+            stage.restart_at = now + delay
+            print(f"[SUPERVISOR] {stage.name} exited (code {stage.process.exitcode}), restarting in {delay:.1f}s")
+            logger.warning("[SUPERVISOR] %s exited with code %s, restart %d in %.1fs",
+                           stage.name, stage.process.exitcode, stage.restarts, delay)
+        elif now >= stage.restart_at:
+            self._start(stage)
+
+    def _drain_stats(self):
+        while True:
+            try:
+                name, pid, sampled_at, cpu_seconds, rss, queues = self.stats_queue.get_nowait()
+            except Empty:
+                return
+            if cpu_seconds is None:
+                continue
+            previous = self._last_samples.get(name)
+            self._last_samples[name] = (pid, sampled_at, cpu_seconds)
+            # The first report of a (re)started process only sets the baseline
+            if previous is None or previous[0] != pid:
+                continue
+            elapsed = sampled_at - previous[1]
+            cpu_percent = 100 * (cpu_seconds - previous[2]) / elapsed if elapsed > 0 else 0.0
+            stage = self.stages.get(name)
+            logger.info("[PROCESS STATS] %s pid=%s cpu=%.1f%% rss=%.1fMB restarts=%d queues=%s",
+                        name, pid, cpu_percent, rss / 2**20, stage.restarts if stage else 0, queues,
+                        extra={"queues": queues})
+
+    def run(self, stats_interval=60, poll_interval=0.5):
+        """Start every stage and supervise them until interrupted."""
+        start_stats_reporter("supervisor", self.stats_queue, stats_interval)
+        for stage in self.stages.values():
+            self._start(stage)
+        try:
+            while not self._stopping:
+                now = time.monotonic()
+                for stage in self.stages.values():
+                    self._check(stage, now)
+                self._drain_stats()
+                time.sleep(poll_interval)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+    def stop(self, timeout=5):
+        """Ask the stages to shut down, then terminate (and finally kill) the ones that don't."""
+        self._stopping = True
+        self.stop_event.set()
+        deadline = time.monotonic() + self.stop_grace
+        for stage in self.stages.values():
+            if stage.process is not None:
+                stage.process.join(max(0, deadline - time.monotonic()))
+        for stage in self.stages.values():
+            if stage.process is not None and stage.process.is_alive():
+                logger.warning("[SUPERVISOR] %s did not stop within %ss, terminating", stage.name, self.stop_grace)
+                stage.process.terminate()
+        for stage in self.stages.values():
+            if stage.process is None:
+                continue
+            stage.process.join(timeout)
+            if stage.process.is_alive():
+                stage.process.kill()
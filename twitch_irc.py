@@ -0,0 +1,235 @@
+"""
+Supervised Twitch IRC connection.
+
+IrcClient keeps one chat connection alive: it reconnects with jittered
+exponential backoff when the socket closes, Twitch sends RECONNECT, or the
+connection stalls, and it measures PING round-trips and message ingest
+latency into an IrcHealth object.
+"""
+import asyncio
+import itertools
+import logging
+import time
+from collections import deque
+from clients import backoff_delay
+
+logger = logging.getLogger("my_app.irc")
+
+def _percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+class IrcHealth:
+    """Connection-health metrics for a long-running chat connection."""
+
+    def __init__(self, samples=500):
+        self.started = time.monotonic()
+        self.connected_since = None
+        self.connected_seconds = 0.0
+        self.connects = 0
+        self.disconnects = 0
+        self.reconnect_requests = 0  # RECONNECT sent by Twitch
+        self.stalls = 0
+        self.messages = 0
+        self.last_message_at = None
+        self.rtt_ms = deque(maxlen=samples)
+        self.ingest_latency_ms = deque(maxlen=samples)
+
+    def mark_connected(self):
+        self.connects += 1
+        self.connected_since = time.monotonic()
+
+    def mark_disconnected(self):
+        if self.connected_since is not None:
+            self.connected_seconds += time.monotonic() - self.connected_since
+            self.connected_since = None
+            self.disconnects += 1
+
+    def uptime_ratio(self):
+        """Share of the process lifetime the chat connection was up."""
+        connected = self.connected_seconds
+        if self.connected_since is not None:
+            connected += time.monotonic() - self.connected_since
+        total = time.monotonic() - self.started
+        return connected / total if total > 0 else 0.0
+
+    def snapshot(self):
+        return {
+            "connected": self.connected_since is not None,
+            "uptime_ratio": round(self.uptime_ratio(), 4),
+            "connects": self.connects,
+            "disconnects": self.disconnects,
+            "reconnect_requests": self.reconnect_requests,
+            "stalls": self.stalls,
+            "messages": self.messages,
+            "rtt_ms_p50": _percentile(self.rtt_ms, 0.5),
+            "rtt_ms_p95": _percentile(self.rtt_ms, 0.95),
+            "ingest_ms_p50": _percentile(self.ingest_latency_ms, 0.5),
+            "ingest_ms_p95": _percentile(self.ingest_latency_ms, 0.95),
+        }
+
+def parse_tags(line):
+    """Split an IRCv3 line into (tags dict, rest of the line)."""
+    if not line.startswith('@'):
+        return {}, line
+    raw_tags, _, rest = line[1:].partition(' ')
+    tags = {}
+    for tag in raw_tags.split(';'):
+        key, _, value = tag.partition('=')
+        tags[key] = value
+    return tags, rest
+
+class IrcClient:
+    def __init__(self, channels, on_privmsg, irc_config=None, health=None):
+        """
+        Args:
+            channels (list): Channel names to join (without '#').
+            on_privmsg (coroutine function): Called as on_privmsg(line) with each
+                PRIVMSG line (IRCv3 tags stripped).
+            irc_config (dict): The twitch.irc section of config.json.
+            health (IrcHealth): Where to record metrics (a new one by default).
+        """
+        irc_config = irc_config or {}
+        self.channels = [c.lower().lstrip('#') for c in channels]
+        self.on_privmsg = on_privmsg
+        self.health = health or IrcHealth()
+
+        self.host = irc_config.get('host', 'irc.chat.twitch.tv')
+        self.use_tls = irc_config.get('tls', True)
+        self.port = irc_config.get('port', 6697 if self.use_tls else 6667)
+        self.nickname = irc_config.get('nickname', 'justinfan12345')  # Anonymous connection
+        self.ping_interval = irc_config.get('ping_interval', 60)
+        # Twitch PINGs roughly every 5 minutes; our own PINGs keep traffic flowing,
+        # so silence longer than this means the connection is dead
+        self.stall_timeout = irc_config.get('stall_timeout', 2 * self.ping_interval + 30)
+        self.connect_timeout = irc_config.get('connect_timeout', 10)
+        self.backoff_base = irc_config.get('backoff_base', 1)
+        self.backoff_max = irc_config.get('backoff_max', 60)
+        # A session must stay up this long before the backoff starts over
+        self.stable_after = irc_config.get('stable_after', 60)
+
+        self._writer = None
+        self._ping_tokens = itertools.count(1)
+        self._pending_pings = {}
+
+    async def run(self):
+        """Connect and keep reconnecting forever."""
+        attempt = 0
+        while True:
+            connected_at = None
+            try:
+                reader, writer = await asyncio.wait_for(
+                    asyncio.open_connection(self.host, self.port, ssl=self.use_tls or None),
+                    timeout=self.connect_timeout
+                )
+                self._writer = writer
+                await self._login()
+                self.health.mark_connected()
+                print(f"[IRC] Connected to {self.host}:{self.port}, joined {', '.join(self.channels)}")
+                connected_at = time.monotonic()
+                reason = await self._session(reader)
+                print(f"[IRC] Connection lost ({reason}), reconnecting...")
+            except (OSError, asyncio.TimeoutError) as e:
+                print(f"[IRC] Connection error: {e!r}")
+            except Exception as e:
+                # Never let one bad line take chat down for good
+                print(f"[IRC] Unexpected error, reconnecting: {e!r}")
+            finally:
+                self.health.mark_disconnected()
+                await self._close()
+
+            # Only a session that stayed up resets the backoff; one the server drops
+            # right after connecting keeps backing off like a failed connect
+            if connected_at is not None and time.monotonic() - connected_at >= self.stable_after:
+                attempt = 0
+            await asyncio.sleep(backoff_delay(attempt, self.backoff_base, self.backoff_max))
+            attempt += 1
+
+    async def report_health(self, interval):
+        """Log a health summary every 'interval' seconds."""
+        while True:
+            await asyncio.sleep(interval)
+            logger.info("[IRC HEALTH] %s", self.health.snapshot())
+
+    async def _login(self):
+        self._send('CAP REQ :twitch.tv/tags twitch.tv/commands')
+        self._send(f'NICK {self.nickname}')
+        if self.channels:
+            self._send('JOIN ' + ','.join(f'#{c}' for c in self.channels))
+        await self._writer.drain()
+
+    def _send(self, line):
+        self._writer.write(f'{line}\r\n'.encode('utf-8'))
+
+    async def _close(self):
+        writer, self._writer = self._writer, None
+        self._pending_pings.clear()
+        if writer is not None:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except (OSError, asyncio.TimeoutError):
+                pass
+
+    async def _ping_loop(self):
+        """Client-initiated PINGs; the matching PONG gives the round-trip time."""
+        while True:
+            await asyncio.sleep(self.ping_interval)
+            token = str(next(self._ping_tokens))
+            self._pending_pings[token] = time.perf_counter()
+            self._send(f'PING :{token}')
+            await self._writer.drain()
+
+    async def _session(self, reader):
+        """Read lines until the connection ends; returns why it ended."""
+        pinger = asyncio.create_task(self._ping_loop())
+        try:
+            while True:
+                try:
+                    raw = await asyncio.wait_for(reader.readline(), timeout=self.stall_timeout)
+                except asyncio.TimeoutError:
+                    self.health.stalls += 1
+                    return f"no data for {self.stall_timeout}s"
+                if not raw:
+                    return "closed by server"
+
+                line = raw.decode('utf-8', errors='replace').rstrip('\r\n')
+                if await self._handle_line(line) == 'RECONNECT':
+                    self.health.reconnect_requests += 1
+                    return "server requested RECONNECT"
+        finally:
+            pinger.cancel()
+
+    async def _handle_line(self, line):
+        tags, line = parse_tags(line)
+
+        if line.startswith('PING'):
+            # Respond with PONG to keep connection alive
+            self._send('PONG' + line[4:])
+            await self._writer.drain()
+            return 'PING'
+
+        # ":prefix COMMAND params"
+        parts = line.split(' ', 2)
+        command = parts[1] if line.startswith(':') and len(parts) > 1 else parts[0]
+
+        if command == 'PRIVMSG':
+            self.health.messages += 1
+            self.health.last_message_at = time.time()
+            sent_ts = tags.get('tmi-sent-ts')
+            if sent_ts and sent_ts.isdigit():
+                self.health.ingest_latency_ms.append(time.time() * 1000 - int(sent_ts))
+            try:
+                await self.on_privmsg(line)
+            except Exception as e:
+                # One line we can't handle shouldn't cost the whole connection
+                print(f"[IRC] Error handling chat line: {e!r}")
+                logger.exception("[IRC] Error handling chat line: %s", line)
+        elif command == 'PONG':
+            token = line.rsplit(':', 1)[-1]
+            sent = self._pending_pings.pop(token, None)
+            if sent is not None:
+                self.health.rtt_ms.append((time.perf_counter() - sent) * 1000)
+        return command
@@ -1,15 +1,17 @@
-import keyboard
-import sounddevice as sd
-import numpy as np
 import wave
-import json
 import os
 import tempfile
 import logging
 from datetime import datetime
-from openai import OpenAI
+from clients import get_openai_client
+from settings import settings
 from pathlib import Path
 from response_formatter import extract_emotion
+from channels import get_channel
+from vad import load_detector, UtteranceSegmenter
+from concurrent.futures import ThreadPoolExecutor
+import queue
+import re
 import time
 
 # Configure logging
@@ -26,19 +28,18 @@ console_handler = logging.StreamHandler()
 console_handler.setFormatter(CleanFormatter())
 logger.handlers = [console_handler]
 
-# Load config
-with open('config.json') as f:
-    config = json.load(f)
-    
-with open('SECRETS.json') as f:
-    secrets = json.load(f)
-    auth_token = secrets["openAI"]["authToken"]
+config = settings.config
 
-client = OpenAI(api_key=auth_token)
 RECORD_KEY = config['ui'].get('record_key', 'k')  # Default to 'k'
 SAMPLE_RATE = 44100
 MIN_AUDIO_LENGTH = 0.5  # Minimum audio length in seconds
-voice_mode = config['voice']['mode']
+
+# "push_to_talk" (hold RECORD_KEY) or "continuous" (VAD + wake word)
+LISTEN_MODE = config['ui'].get('listen_mode', 'push_to_talk')
+VAD_SAMPLE_RATE = 16000  # Whisper works at 16 kHz anyway, and uploads are smaller
+VAD_FRAMES_PER_BLOCK = 3
+SEGMENTER_KEYS = ('start_ms', 'end_ms', 'preroll_ms', 'min_speech_ms', 'pause_ms',
+                  'chunk_min_s', 'chunk_max_s', 'max_utterance_s')
 
 class VoiceRecorder:
     def __init__(self, gpt_callback):
@@ -47,6 +48,10 @@ class VoiceRecorder:
         self.gpt_callback = gpt_callback
 
     def start_recording(self):
+        # Audio libraries are only needed once the streamer actually records
+        import sounddevice as sd
+        import numpy as np
+
         if not self.recording:
             print("\nStarting recording...")  # Simplified log message
             self.recording = True
@@ -68,6 +73,8 @@ class VoiceRecorder:
             print("\nRecording... (Release key to stop)")
 
     def stop_recording(self):
+        import numpy as np
+
         if self.recording:
             self.recording = False
             self.stream.stop()
@@ -82,56 +89,169 @@ class VoiceRecorder:
                     print("\nReady to record...")
                     return
                 
-                with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as temp_wav:
-                    wav_path = temp_wav.name
-                    with wave.open(wav_path, 'wb') as wf:
-                        wf.setnchannels(1)
-                        wf.setsampwidth(2)
-                        wf.setframerate(SAMPLE_RATE)
-                        wf.writeframes((audio_data * 32767).astype(np.int16).tobytes())
-                
                 try:
-                    with open(wav_path, "rb") as audio_file:
-                        transcription = client.audio.transcriptions.create(
-                            model="whisper-1",
-                            file=audio_file,
-                            response_format="text"
-                        )
-                    logger.debug(f"Whisper API response: {transcription}")
-                    if not transcription.strip():
-                        logger.debug("Transcription result is empty.")
-                        raise ValueError("Transcription result is empty.")
+                    transcription = transcribe_audio(audio_data, SAMPLE_RATE)
                     if transcription:
                         print(f"\nTranscribed: {transcription}")
-                        # Get GPT response through callback
-                        gpt_response = self.gpt_callback(transcription)
-                        
-                        if gpt_response:
-                            # Extract emotion from GPT response
-                            emotion, cleaned_text = extract_emotion(gpt_response)
-                            print(f"[GPT RESPONSE][{emotion}]: {cleaned_text}")
-                            
-                            if voice_mode == 'openai':
-                                from voice_openai import add_to_voice_queue
-                            elif voice_mode == 'elevenlabs':
-                                from voice import add_to_voice_queue
-                                
-                            # Add to voice queue with extracted emotion
-                            add_to_voice_queue(cleaned_text, emotion=emotion)
+                        respond_to_transcription(self.gpt_callback, transcription)
                     
                 except Exception as e:
-                    logger.error(f"Transcription error: {str(e)}")
+                    logger.error("Transcription error: %s", e)
                     print(f"\nError transcribing audio: {str(e)}")
-                    
-                finally:
-                    try:
-                        os.unlink(wav_path)
-                    except Exception as e:
-                        logger.error(f"Error cleaning up temp file: {str(e)}")
             
             print("\nReady to record...")
 
+def transcribe_audio(audio_data, sample_rate, prompt=None):
+    """Send float32 mono samples to Whisper and return the transcription text."""
+    import numpy as np
+
+    with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as temp_wav:
+        wav_path = temp_wav.name
+        with wave.open(wav_path, 'wb') as wf:
+            wf.setnchannels(1)
+            wf.setsampwidth(2)
+            wf.setframerate(sample_rate)
+            wf.writeframes((audio_data * 32767).astype(np.int16).tobytes())
+
+    try:
+        with open(wav_path, "rb") as audio_file:
+            transcription = get_openai_client().audio.transcriptions.create(
+                model="whisper-1",
+                file=audio_file,
+                response_format="text",
+                **({"prompt": prompt} if prompt else {})
+            )
+        logger.debug("Whisper API response: %s", transcription)
+        if not transcription.strip():
+            logger.debug("Transcription result is empty.")
+            raise ValueError("Transcription result is empty.")
+        return transcription
+    finally:
+        try:
+            os.unlink(wav_path)
+        except Exception as e:
+            logger.error("Error cleaning up temp file: %s", e)
+
+def respond_to_transcription(gpt_callback, transcription):
+    """Get the GPT reply for what the streamer said and queue it for TTS."""
+    # Get GPT response through callback
+    gpt_response = gpt_callback(transcription)
+    
+    if gpt_response:
+        # Extract emotion from GPT response
+        emotion, cleaned_text = extract_emotion(gpt_response)
+        print(f"[GPT RESPONSE][{emotion}]: {cleaned_text}")
+        
+        from voice_queue import add_to_voice_queue
+
+        # Add to voice queue with extracted emotion
+        add_to_voice_queue(cleaned_text, emotion=emotion)
+
+class ContinuousListener:
+    """
+    Hands-free voice input: listens all the time, finds utterances with a
+    VAD and only answers the ones that contain a wake word (the AI's name by
+    default). Chunks of long utterances are transcribed while the streamer
+    is still talking, so after they stop only the tail is left to upload.
+    """
+
+    def __init__(self, gpt_callback, vad_config, wake_words):
+        self.gpt_callback = gpt_callback
+        self.frame_ms = vad_config.get('frame_ms', 30)
+        self.frame_len = VAD_SAMPLE_RATE * self.frame_ms // 1000
+        self.detector = load_detector(
+            vad_config.get('detector', 'energy'), VAD_SAMPLE_RATE, self.frame_ms,
+            **vad_config.get('detector_options', {}))
+        self.segmenter = UtteranceSegmenter(
+            self.frame_ms, **{key: vad_config[key] for key in SEGMENTER_KEYS if key in vad_config})
+        self.wake_words = wake_words
+        self.wake_pattern = re.compile(
+            r"\b(?:" + "|".join(re.escape(word) for word in wake_words) + r")\b", re.IGNORECASE)
+
+        self.blocks = queue.Queue()
+        # Chunk uploads run in parallel; replies go out one at a time, in order
+        self.upload_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="stt-upload")
+        self.reply_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="stt-reply")
+        self.pending = []
+
+        # VAD cost: processing time vs. audio time
+        self.vad_seconds = 0.0
+        self.audio_seconds = 0.0
+
+    def _transcribe(self, audio):
+        return transcribe_audio(audio, VAD_SAMPLE_RATE, prompt=", ".join(self.wake_words))
+
+    def _finish(self, futures, speech_end_at, endpoint_at):
+        texts = []
+        for future in futures:
+            try:
+                texts.append(future.result().strip())
+            except Exception as e:
+                logger.debug("Segment transcription failed: %s", e)
+        text = " ".join(t for t in texts if t)
+        ready_at = time.monotonic()
+
+        logger.info("[VAD] endpoint %.0f ms, transcript %.0f ms after speech end (%d early chunk(s)), vad cpu %.2f%%",
+                    (endpoint_at - speech_end_at) * 1000, (ready_at - speech_end_at) * 1000,
+                    len(futures) - 1, 100 * self.vad_seconds / max(self.audio_seconds, 1e-9))
+        if not text:
+            return
+        if not self.wake_pattern.search(text):
+            logger.debug("No wake word, ignored: %s", text)
+            return
+
+        print(f"\nTranscribed: {text}")
+        try:
+            respond_to_transcription(self.gpt_callback, text)
+        except Exception as e:
+            print(f"\nError responding to voice input: {str(e)}")
+
+    def process_block(self, samples, arrived_at):
+        """Run the VAD over one block of samples and act on the utterance events."""
+        started = time.perf_counter()
+        frames = samples[:len(samples) // self.frame_len * self.frame_len].reshape(-1, self.frame_len)
+        events = self.segmenter.push(frames, self.detector.is_speech(frames), arrived_at)
+        self.vad_seconds += time.perf_counter() - started
+        self.audio_seconds += len(samples) / VAD_SAMPLE_RATE
+
+        for event in events:
+            if event[0] == "chunk":
+                self.pending.append(self.upload_pool.submit(self._transcribe, event[1]))
+            else:
+                _, audio, speech_end_at = event
+                futures, self.pending = self.pending, []
+                if audio is not None:
+                    futures.append(self.upload_pool.submit(self._transcribe, audio))
+                self.reply_pool.submit(self._finish, futures, speech_end_at, time.monotonic())
+
+    def run(self):
+        import sounddevice as sd
+        import numpy as np
+
+        def audio_callback(indata, frames, time_info, status):
+            if status:
+                print(f"Audio status: {status}")
+            self.blocks.put((time.monotonic(), indata[:, 0].copy()))
+
+        with sd.InputStream(channels=1, samplerate=VAD_SAMPLE_RATE, dtype=np.float32,
+                            blocksize=self.frame_len * VAD_FRAMES_PER_BLOCK, callback=audio_callback):
+            print(f"\nListening... (say {' or '.join(self.wake_words)} to talk to the AI)")
+            while True:
+                arrived_at, samples = self.blocks.get()
+                self.process_block(samples, arrived_at)
+
 def start_voice_ui(gpt_callback):
+    if LISTEN_MODE == 'continuous':
+        vad_config = config['ui'].get('vad', {})
+        wake_words = config['ui'].get('wake_words') or [get_channel().ai_name]
+        try:
+            ContinuousListener(gpt_callback, vad_config, wake_words).run()
+        except KeyboardInterrupt:
+            pass
+        return
+
+    import keyboard
+
     recorder = VoiceRecorder(gpt_callback)
     time.sleep(3)
     print(f"\nPress and hold {RECORD_KEY} to record...")
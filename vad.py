@@ -0,0 +1,176 @@
+"""
+Voice-activity detection for hands-free voice input.
+
+A detector classifies fixed-size audio frames as speech or not; the
+UtteranceSegmenter turns those flags into utterances. Long utterances are
+cut into chunks at short pauses while the streamer is still talking, so
+they can be transcribed before the utterance ends.
+
+The built-in EnergyVad is a vectorized energy/zero-crossing detector. Any
+other detector (e.g. a wrapper around a neural VAD) can be plugged in with
+"package.module:ClassName" in config['ui']['vad']['detector']; it is built
+as Class(sample_rate, frame_ms, **detector_options) and must provide
+is_speech(frames) -> boolean array, one flag per row of 'frames'.
+"""
+import importlib
+from collections import deque
+
+class EnergyVad:
+    """
+    Frames are speech when they are well above the noise floor and not
+    noise-like (high zero-crossing rate), or much louder still (fricatives).
+    The noise floor only learns from frames classified as non-speech: it
+    follows them down immediately and creeps up slowly, so talking never
+    raises it. It never goes below floor_db, so digital silence (a muted mic)
+    can't make ordinary room noise look like speech. A sound that is
+    classified as speech without a break for steady_s (a fan or hum, not a
+    person) becomes the new floor.
+    """
+
+    def __init__(self, sample_rate, frame_ms, margin_db=10.0, zcr_max=0.25,
+                 floor_db=-60.0, floor_rise=0.02, steady_s=30):
+        self.sample_rate = sample_rate
+        self.frame_ms = frame_ms
+        self.margin_db = margin_db
+        self.zcr_max = zcr_max
+        self.min_floor_db = floor_db
+        self.noise_floor_db = floor_db
+        self.floor_rise = floor_rise
+        self.steady_frames = max(1, round(steady_s * 1000 / frame_ms))
+        self._speech_run = 0             # frames classified as speech since the last non-speech frame
+        self._speech_run_min_db = None   # quietest of those
+
+    def is_speech(self, frames):
+        import numpy as np
+
+        energy_db = 10 * np.log10(np.mean(np.square(frames), axis=1) + 1e-10)
+        signs = np.signbit(frames)
+        zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / (frames.shape[1] - 1)
+
+        threshold = self.noise_floor_db + self.margin_db
+        speech = ((energy_db > threshold) & (zcr < self.zcr_max)) | (energy_db > threshold + 10)
+
+        quiet = np.flatnonzero(~speech)
+        if quiet.size:
+            quietest = max(float(energy_db[quiet].min()), self.min_floor_db)
+            if quietest < self.noise_floor_db:
+                self.noise_floor_db = quietest
+            else:
+                self.noise_floor_db += self.floor_rise * (quietest - self.noise_floor_db)
+            # Speech frames after the last quiet one start a new run
+            tail = energy_db[quiet[-1] + 1:]
+            self._speech_run = len(tail)
+            self._speech_run_min_db = float(tail.min()) if len(tail) else None
+        else:
+            self._speech_run += len(speech)
+            block_min = float(energy_db.min())
+            if self._speech_run_min_db is None or block_min < self._speech_run_min_db:
+                self._speech_run_min_db = block_min
+            if self._speech_run >= self.steady_frames:
+                # Nobody talks this long without a pause; it's background noise
+                self.noise_floor_db = max(self._speech_run_min_db, self.min_floor_db)
+                self._speech_run = 0
+                self._speech_run_min_db = None
+        return speech
+
+def load_detector(spec, sample_rate, frame_ms, **options):
+    """Build the detector named by 'spec': "energy" or "package.module:ClassName"."""
+    if spec in (None, "", "energy"):
+        return EnergyVad(sample_rate, frame_ms, **options)
+    module_name, _, class_name = spec.partition(":")
+    detector_class = getattr(importlib.import_module(module_name), class_name)
+    return detector_class(sample_rate, frame_ms, **options)
+
+class UtteranceSegmenter:
+    """
+    Turns per-frame speech flags into utterance events:
+
+        ("chunk", audio)                a finished piece of an ongoing utterance
+        ("end", audio, speech_end_at)   the rest of the utterance (audio is None
+                                        if it holds no speech), and the
+                                        monotonic time speech stopped
+
+    Times are derived from the arrival time of each block, so speech_end_at is
+    when the last speech frame was captured, not when it was processed.
+    """
+
+    def __init__(self, frame_ms, start_ms=90, end_ms=700, preroll_ms=300, min_speech_ms=300,
+                 pause_ms=250, chunk_min_s=4, chunk_max_s=10, max_utterance_s=30):
+        to_frames = lambda ms: max(1, round(ms / frame_ms))
+        self.frame_s = frame_ms / 1000
+        self.start_frames = to_frames(start_ms)
+        self.end_frames = to_frames(end_ms)
+        self.min_speech_frames = to_frames(min_speech_ms)
+        self.pause_frames = to_frames(pause_ms)
+        self.chunk_min_frames = to_frames(chunk_min_s * 1000)
+        self.chunk_max_frames = to_frames(chunk_max_s * 1000)
+        self.max_frames = to_frames(max_utterance_s * 1000)
+        self.preroll = deque(maxlen=max(self.start_frames, to_frames(preroll_ms)))
+        self._reset()
+
+    def _reset(self):
+        self.active = False
+        self.run = 0             # consecutive speech frames while idle
+        self.silence = 0         # consecutive non-speech frames while active
+        self.speech_frames = 0   # speech frames in the utterance
+        self.total_frames = 0
+        self.chunks_sent = 0
+        self.chunk = []
+        self.chunk_has_speech = False
+        self.speech_end_at = None
+
+    def _take_chunk(self, keep_silence):
+        import numpy as np
+
+        frames = self.chunk
+        # Drop most of the trailing silence; whisper doesn't need it
+        trailing = max(0, self.silence - keep_silence)
+        if trailing:
+            frames = frames[:max(0, len(frames) - trailing)]
+        audio = np.concatenate(frames) if frames and self.chunk_has_speech else None
+        self.chunk = []
+        self.chunk_has_speech = False
+        return audio
+
+    def push(self, frames, flags, arrived_at):
+        """Feed one block (rows of 'frames' with their speech 'flags'); returns a list of events."""
+        events = []
+        count = len(flags)
+        for index in range(count):
+            frame, speech = frames[index], bool(flags[index])
+            frame_end_at = arrived_at - (count - 1 - index) * self.frame_s
+
+            if not self.active:
+                self.preroll.append(frame)
+                self.run = self.run + 1 if speech else 0
+                if self.run >= self.start_frames:
+                    self.active = True
+                    self.chunk = list(self.preroll)
+                    self.chunk_has_speech = True
+                    self.total_frames = len(self.chunk)
+                    self.speech_frames = self.run
+                    self.speech_end_at = frame_end_at
+                    self.preroll.clear()
+                continue
+
+            self.chunk.append(frame)
+            self.total_frames += 1
+            if speech:
+                self.silence = 0
+                self.speech_frames += 1
+                self.chunk_has_speech = True
+                self.speech_end_at = frame_end_at
+            else:
+                self.silence += 1
+
+            if self.silence >= self.end_frames or self.total_frames >= self.max_frames:
+                if self.speech_frames >= self.min_speech_frames or self.chunks_sent:
+                    events.append(("end", self._take_chunk(self.pause_frames), self.speech_end_at))
+                self._reset()
+            elif len(self.chunk) >= self.chunk_max_frames or (
+                    len(self.chunk) >= self.chunk_min_frames and self.silence >= self.pause_frames):
+                audio = self._take_chunk(self.pause_frames)
+                if audio is not None:
+                    self.chunks_sent += 1
+                    events.append(("chunk", audio))
+        return events
@@ -0,0 +1,107 @@
+"""
+The TTS pipeline shared by every voice provider: the per-channel text queue,
+the worker pool and clip cleanup. Provider modules (voice.py for ElevenLabs,
+voice_openai.py for OpenAI) only supply the call that turns text into an
+audio file, and run the pool with it via run_voice_workers().
+"""
+import asyncio
+from channels import CHANNELS, FairQueue, get_channel
+from settings import settings
+from datetime import datetime
+from queue import Empty
+from pathlib import Path
+from lipsync import write_envelope, envelope_path
+
+config = settings.config
+
+output_dir = Path(settings.output_dir)
+# Shared TTS worker pool size (all channels draw from the same pool). A channel's
+# replies are synthesized one at a time to keep them in order, so extra workers only
+# help with several channels
+VOICE_WORKERS = min(config['voice'].get('workers', 2), len(CHANNELS))
+MAX_CLIPS = 20 * len(CHANNELS)
+
+# This queue holds text waiting to be turned into audio, one lane per channel
+voice_buffer = FairQueue()
+
+# Running cleanup_mp3_files pass, if any (see schedule_cleanup)
+_cleanup_task = None
+
+def add_to_voice_queue(text: str, emotion=None, channel=None):
+    # Store (text, emotion) in the channel's lane; default is the first channel
+    channel = channel or get_channel()
+    voice_buffer.put(channel.name, (text, emotion))
+
+async def cleanup_mp3_files(directory: Path, max_files: int = 20):
+    """
+    Asynchronously ensure that the number of .mp3 files in 'directory'
+    does not exceed 'max_files'. If it does, delete the oldest files
+    (and their lip-sync envelopes).
+    """
+    # Gather all .mp3 files
+    mp3_files = list(directory.glob("*.mp3"))
+
+    # Sort by modification time, oldest first
+    mp3_files.sort(key=lambda f: f.stat().st_mtime)
+
+    # If total files exceed max_files, delete the extra oldest ones
+    if len(mp3_files) > max_files:
+        num_to_remove = len(mp3_files) - max_files
+        for i in range(num_to_remove):
+            try:
+                mp3_files[i].unlink()
+                envelope_path(mp3_files[i]).unlink(missing_ok=True)
+            except Exception as e:
+                print(f"Error deleting file {mp3_files[i].name}: {e}")
+
+def schedule_cleanup():
+    """
+    Prune old clips in the background. The task is kept referenced (an
+    unreferenced task can be garbage-collected mid-run), and a new one is
+    only started once the previous pass has finished.
+    """
+    global _cleanup_task
+    if _cleanup_task is None or _cleanup_task.done():
+        _cleanup_task = asyncio.create_task(cleanup_mp3_files(output_dir, max_files=MAX_CLIPS))
+
+async def run_voice_workers(audio_queue, synthesize, provider, workers=VOICE_WORKERS):
+    """
+    Run the shared TTS worker pool. Channels are served round-robin and
+    finished clips go to audio_queue as (path, emotion, envelope, channel_name).
+
+    Args:
+        synthesize (callable): Blocking synthesize(text, channel, output_path)
+            that writes the clip for 'channel' to output_path.
+        provider (str): Provider name for error messages.
+    """
+    await asyncio.gather(*(_voice_worker(audio_queue, synthesize, provider) for _ in range(workers)))
+
+async def _voice_worker(audio_queue, synthesize, provider):
+    while True:
+        try:
+            channel_name, (text, emotion) = voice_buffer.get_nowait()
+        except Empty:
+            # Small delay to let other coroutines run
+            await asyncio.sleep(0.1)
+            continue
+
+        try:
+            channel = get_channel(channel_name)
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+            output_file = f"voice_output_{channel.name}_{timestamp}.mp3"
+            output_path = output_dir / output_file
+
+            # The SDK call blocks, so run it off the loop; other workers keep going
+            await asyncio.to_thread(synthesize, text, channel, output_path)
+
+            # Precompute the lip-sync envelope once, while the clip is fresh
+            envelope = await asyncio.to_thread(write_envelope, output_path)
+            audio_queue.put((str(output_path), emotion, envelope, channel.name))
+
+            schedule_cleanup()
+
+        except Exception as e:
+            print(f"{provider} TTS error: {e}")
+        finally:
+            # The channel's next reply can be synthesized now; this clip is already queued
+            voice_buffer.task_done(channel_name)